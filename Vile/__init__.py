@@ -4,6 +4,11 @@ from .message_api import MessageAPI
 from .moderation_api import ModerationAPI
 from .role_api import RoleAPI
 from .voice_api import VoiceAPI
+from .storage import Storage, SQLiteStorage
+from .warn_ledger import WarnLedger, EscalationRule
+from .http_client import HTTPClient
+from .cluster import IPCBus, ShardedStorage, run_cluster
+from .instrumentation import metrics, instrument_discord_http, Benchmark, save_baseline, compare_baseline
 
 __all__ = [
     'DiscordAPI',
@@ -11,5 +16,18 @@ __all__ = [
     'MessageAPI',
     'ModerationAPI',
     'RoleAPI',
-    'VoiceAPI'
+    'VoiceAPI',
+    'Storage',
+    'SQLiteStorage',
+    'WarnLedger',
+    'EscalationRule',
+    'HTTPClient',
+    'IPCBus',
+    'ShardedStorage',
+    'run_cluster',
+    'metrics',
+    'instrument_discord_http',
+    'Benchmark',
+    'save_baseline',
+    'compare_baseline'
 ]
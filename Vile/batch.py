@@ -0,0 +1,35 @@
+import discord
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable
+
+def summarize_batch(results: Dict[Hashable, bool], started: float) -> Dict:
+    elapsed = time.monotonic() - started
+    succeeded = sum(1 for ok in results.values() if ok)
+    return {
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed': elapsed,
+        'per_second': len(results) / elapsed if elapsed > 0 else float(len(results))
+    }
+
+async def run_batch(
+    items: Iterable[Any],
+    action: Callable[[Any], Awaitable[Any]],
+    concurrency: int = 5,
+    key: Callable[[Any], Hashable] = lambda item: item.id
+) -> Dict:
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def run(item: Any) -> None:
+        async with semaphore:
+            try:
+                results[key(item)] = bool(await action(item))
+            except discord.HTTPException:
+                results[key(item)] = False
+
+    await asyncio.gather(*(run(item) for item in items))
+    return summarize_batch(results, started)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+def copy_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, copy: Optional[Callable[[Any], Any]] = None):
+        self.maxsize = maxsize
+        self.copy = copy
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() < entry[1]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return default
+        self._entries.move_to_end(key)
+        return self._copy(entry[0])
+
+    def _copy(self, value: Any) -> Any:
+        if self.copy is None or value is None:
+            return value
+        return self.copy(value)
+
+    def set(self, key: Hashable, value: Any, ttl: float, stale_ttl: float = 0) -> None:
+        now = time.monotonic()
+        self._entries[key] = (self._copy(value), now + ttl, now + ttl + stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float = 0) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            now = time.monotonic()
+            if now < expires_at:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._copy(value)
+            if now < stale_until:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    self._start_fetch(key, fetch, ttl, stale_ttl)
+                return self._copy(value)
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start_fetch(key, fetch, ttl, stale_ttl)
+        return self._copy(await asyncio.shield(task))
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float) -> asyncio.Task:
+        task = asyncio.ensure_future(self._fetch(key, fetch, ttl, stale_ttl))
+        self._inflight[key] = task
+        return task
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float) -> Any:
+        try:
+            value = await fetch()
+        finally:
+            self._inflight.pop(key, None)
+
+        if value is not None:
+            self.set(key, value, ttl, stale_ttl)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'size': len(self._entries),
+            'inflight': len(self._inflight)
+        }
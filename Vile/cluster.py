@@ -0,0 +1,300 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from .storage import Storage
+from .instrumentation import metrics
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    return (int(guild_id) >> 22) % shard_count
+
+def shard_ids_for_cluster(cluster_id: int, cluster_count: int, shard_count: int) -> List[int]:
+    return list(range(cluster_id, shard_count, cluster_count))
+
+def cluster_for(guild_id: int, shard_count: int, cluster_count: int) -> int:
+    return shard_for(guild_id, shard_count) % cluster_count
+
+class ShardedStorage(Storage):
+    def __init__(self, storage: Storage, shard_ids: Iterable[int], shard_count: int):
+        self.storage = storage
+        self.shard_ids = frozenset(shard_ids)
+        self.shard_count = shard_count
+
+    def owns(self, guild_id: Any) -> bool:
+        guild_id = str(guild_id)
+        if not guild_id.isdigit():
+            return True
+        return shard_for(int(guild_id), self.shard_count) in self.shard_ids
+
+    def set(self, namespace: str, guild_id: Any, key: Any, value: Any) -> None:
+        self.storage.set(namespace, guild_id, key, value)
+
+    def delete(self, namespace: str, guild_id: Any, key: Any) -> None:
+        self.storage.delete(namespace, guild_id, key)
+
+    async def get(self, namespace: str, guild_id: Any, key: Any) -> Optional[Any]:
+        return await self.storage.get(namespace, guild_id, key)
+
+    async def load(self, namespace: str) -> Dict[str, Dict[str, Any]]:
+        data = await self.storage.load(namespace)
+        return {guild_id: entries for guild_id, entries in data.items() if self.owns(guild_id)}
+
+    async def expire(self, namespace: str, field: str, cutoff: float) -> int:
+        return await self.storage.expire(namespace, field, cutoff)
+
+    async def load_guild(self, guild_id: Any) -> Dict[str, Dict[str, Any]]:
+        return await self.storage.load_guild(guild_id)
+
+    async def flush(self) -> None:
+        await self.storage.flush()
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+class IPCError(Exception):
+    pass
+
+class _Peer:
+    __slots__ = ('reader', 'writer', 'pending', 'task', 'lock')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.task = None
+        self.lock = asyncio.Lock()
+
+class IPCBus:
+    def __init__(self, cluster_id: int, cluster_count: int, socket_dir: str = '/tmp/vile-ipc', timeout: float = 5.0):
+        self.cluster_id = cluster_id
+        self.cluster_count = cluster_count
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+        self._handlers = {}
+        self._server = None
+        self._peers = {}
+        self._connections = {}
+        self._dispatches = set()
+        self._next_id = 0
+
+    def socket_path(self, cluster_id: int) -> str:
+        return os.path.join(self.socket_dir, f'vile-{cluster_id}.sock')
+
+    def register(self, op: str, handler: Callable[[Any], Awaitable[Any]]) -> None:
+        self._handlers[op] = handler
+
+    async def start(self) -> None:
+        os.makedirs(self.socket_dir, exist_ok=True)
+        path = self.socket_path(self.cluster_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = await asyncio.start_unix_server(self._serve, path=path)
+
+    async def close(self) -> None:
+        for peer in self._peers.values():
+            if peer.task is not None:
+                peer.task.cancel()
+            peer.writer.close()
+        self._peers.clear()
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            connections = list(self._connections.items())
+            for writer, task in connections:
+                writer.close()
+            await asyncio.gather(*(task for writer, task in connections), return_exceptions=True)
+            for task in self._dispatches:
+                task.cancel()
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+            try:
+                os.unlink(self.socket_path(self.cluster_id))
+            except FileNotFoundError:
+                pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                task = asyncio.ensure_future(self._dispatch(message, writer))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _dispatch(self, message: Dict, writer: asyncio.StreamWriter) -> None:
+        reply = {'id': message['id']}
+        try:
+            reply['result'] = await self._call_local(message['op'], message.get('payload'))
+        except Exception as error:
+            metrics.record_error(error)
+            reply['error'] = f"{type(error).__name__}: {error}"
+
+        try:
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _call_local(self, op: str, payload: Any) -> Any:
+        handler = self._handlers.get(op)
+        if handler is None:
+            raise IPCError(f"No handler for {op}")
+        return await handler(payload)
+
+    async def _connect(self, cluster_id: int) -> _Peer:
+        peer = self._peers.get(cluster_id)
+        if peer is not None and not peer.task.done():
+            return peer
+        if peer is not None:
+            peer.writer.close()
+
+        reader, writer = await asyncio.open_unix_connection(self.socket_path(cluster_id))
+        peer = self._peers[cluster_id] = _Peer(reader, writer)
+        peer.task = asyncio.ensure_future(self._read_replies(peer))
+        return peer
+
+    async def _read_replies(self, peer: _Peer) -> None:
+        try:
+            while True:
+                line = await peer.reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = peer.pending.pop(reply['id'], None)
+                if future is None or future.done():
+                    continue
+                if 'error' in reply:
+                    future.set_exception(IPCError(reply['error']))
+                else:
+                    future.set_result(reply.get('result'))
+        finally:
+            for future in peer.pending.values():
+                if not future.done():
+                    future.set_exception(IPCError("Connection closed"))
+            peer.pending.clear()
+
+    async def request(self, cluster_id: int, op: str, payload: Any = None) -> Any:
+        if cluster_id == self.cluster_id:
+            return await self._call_local(op, payload)
+
+        peer = await self._connect(cluster_id)
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        peer.pending[request_id] = future
+
+        async with peer.lock:
+            peer.writer.write(json.dumps({'id': request_id, 'op': op, 'payload': payload}).encode() + b'\n')
+            await peer.writer.drain()
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            peer.pending.pop(request_id, None)
+
+    async def broadcast(self, op: str, payload: Any = None) -> Dict[int, Any]:
+        cluster_ids = range(self.cluster_count)
+        results = await asyncio.gather(
+            *(self.request(cluster_id, op, payload) for cluster_id in cluster_ids),
+            return_exceptions=True
+        )
+        return {
+            cluster_id: result
+            for cluster_id, result in zip(cluster_ids, results)
+            if not isinstance(result, BaseException)
+        }
+
+def register_default_handlers(bus: IPCBus, bot) -> None:
+    from .discord_api import _user_data
+
+    async def stats(payload: Any) -> Dict:
+        return {
+            'cluster_id': bus.cluster_id,
+            'shard_ids': list(getattr(bot, 'shard_ids', None) or []),
+            'guilds': len(bot.guilds),
+            'members': sum(guild.member_count or 0 for guild in bot.guilds),
+            'latency': bot.latency
+        }
+
+    async def get_user(payload: Any) -> Optional[Dict]:
+        user = bot.get_user(int(payload))
+        return _user_data(user) if user is not None else None
+
+    bus.register('stats', stats)
+    bus.register('get_user', get_user)
+
+async def global_stats(bus: IPCBus) -> Dict:
+    replies = await bus.broadcast('stats')
+    return {
+        'clusters': len(replies),
+        'guilds': sum(reply['guilds'] for reply in replies.values()),
+        'members': sum(reply['members'] for reply in replies.values()),
+        'per_cluster': replies
+    }
+
+async def find_user(bus: IPCBus, user_id: int) -> Optional[Dict]:
+    for reply in (await bus.broadcast('get_user', user_id)).values():
+        if reply is not None:
+            return reply
+    return None
+
+def _run_worker(setup, cluster_id: int, cluster_count: int, shard_count: int, socket_dir: str) -> None:
+    async def main() -> None:
+        bus = IPCBus(cluster_id, cluster_count, socket_dir)
+        await bus.start()
+        try:
+            await setup(cluster_id, shard_ids_for_cluster(cluster_id, cluster_count, shard_count), shard_count, bus)
+        finally:
+            await bus.close()
+
+    asyncio.run(main())
+
+def run_cluster(
+    setup: Callable[[int, List[int], int, IPCBus], Awaitable[None]],
+    shard_count: int,
+    cluster_count: int,
+    socket_dir: str = '/tmp/vile-ipc',
+    restart_delay: float = 5.0
+) -> None:
+    context = multiprocessing.get_context('spawn')
+    processes = {}
+
+    def spawn(cluster_id: int) -> None:
+        process = context.Process(
+            target=_run_worker,
+            args=(setup, cluster_id, cluster_count, shard_count, socket_dir),
+            name=f'vile-cluster-{cluster_id}'
+        )
+        process.start()
+        processes[cluster_id] = process
+
+    for cluster_id in range(cluster_count):
+        spawn(cluster_id)
+
+    try:
+        while processes:
+            time.sleep(1)
+            for cluster_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    del processes[cluster_id]
+                    continue
+                time.sleep(restart_delay)
+                spawn(cluster_id)
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
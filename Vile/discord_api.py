@@ -2,134 +2,514 @@ import discord
 from discord.ext import commands
 import aiohttp
 import io
-from PIL import Image
+from PIL import Image, ImageSequence
 import asyncio
-from typing import Union, List, Optional
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, List, Optional, Dict, Iterable, Tuple, AsyncIterator
 import json
 import datetime
+import time
+from collections import deque
+from .batch import summarize_batch
+from .cache import TTLCache, copy_json
+from .http_client import HTTPClient
+from .instrumentation import instrument_class, metrics
 
+EMOJI_MAX_BYTES = 256 * 1024
+EMOJI_MAX_SIZE = 128
+
+def _shrink_image(data: bytes, max_bytes: int) -> Optional[bytes]:
+    try:
+        image = Image.open(io.BytesIO(data))
+        animated = getattr(image, 'is_animated', False)
+        size = min(max(image.size), EMOJI_MAX_SIZE)
+        
+        while size >= 16:
+            output = io.BytesIO()
+            if animated:
+                frames = []
+                durations = []
+                for frame in ImageSequence.Iterator(image):
+                    resized = frame.convert('RGBA')
+                    resized.thumbnail((size, size))
+                    frames.append(resized)
+                    durations.append(frame.info.get('duration', 100))
+                frames[0].save(
+                    output,
+                    format='GIF',
+                    save_all=True,
+                    append_images=frames[1:],
+                    duration=durations,
+                    loop=0,
+                    disposal=2,
+                    optimize=True
+                )
+            else:
+                resized = image.convert('RGBA')
+                resized.thumbnail((size, size))
+                resized.save(output, format='PNG', optimize=True)
+                
+            if output.tell() <= max_bytes:
+                return output.getvalue()
+            size = int(size * 0.75)
+        return None
+    except Exception:
+        return None
+
+def _user_data(user: discord.abc.User) -> dict:
+    banner = getattr(user, 'banner', None)
+    return {
+        'id': str(user.id),
+        'name': user.name,
+        'discriminator': user.discriminator,
+        'avatar_url': str(user.avatar.url) if user.avatar else None,
+        'banner_url': str(banner.url) if banner else None,
+        'bot': user.bot,
+        'created_at': user.created_at.isoformat()
+    }
+
+def _member_data(member: discord.Member) -> dict:
+    return {
+        'id': str(member.id),
+        'name': member.name,
+        'nick': member.nick,
+        'roles': [str(role.id) for role in member.roles],
+        'joined_at': member.joined_at.isoformat() if member.joined_at else None,
+        'premium_since': member.premium_since.isoformat() if member.premium_since else None
+    }
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+@instrument_class
 class DiscordAPI:
-    def __init__(self, bot):
+    def __init__(
+        self,
+        bot,
+        http: Optional[HTTPClient] = None,
+        image_workers: int = 2,
+        ban_snapshot_ttl: float = 300,
+        cache_size: int = 10000,
+        user_cache_ttl: float = 300,
+        member_cache_ttl: float = 60
+    ):
         self.bot = bot
-        self._session = None
+        self.http = http or HTTPClient.shared()
+        self.image_workers = image_workers
+        self._image_pool = None
+        self.ban_snapshot_ttl = ban_snapshot_ttl
+        self._ban_snapshots = {}
+        self._audit_snapshots = {}
+        self.cache = TTLCache(cache_size, copy=copy_json)
+        self.user_cache_ttl = user_cache_ttl
+        self.member_cache_ttl = member_cache_ttl
         
     @property
     def session(self):
-        if self._session is None:
-            self._session = aiohttp.ClientSession()
-        return self._session
+        return self.http.session
         
     async def close(self):
-        if self._session:
-            await self._session.close()
+        await self.http.close()
+        if self._image_pool is not None:
+            self._image_pool.shutdown(wait=False)
+            self._image_pool = None
             
-    async def fetch_user_data(self, user_id: int) -> Optional[dict]:
+    async def fetch_user_data(self, user_id: int, use_gateway: bool = False) -> Optional[dict]:
+        if use_gateway:
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                return _user_data(user)
+
         try:
-            user = await self.bot.fetch_user(user_id)
-            return {
-                'id': str(user.id),
-                'name': user.name,
-                'discriminator': user.discriminator,
-                'avatar_url': str(user.avatar.url) if user.avatar else None,
-                'banner_url': str(user.banner.url) if user.banner else None,
-                'bot': user.bot,
-                'created_at': user.created_at.isoformat()
-            }
-        except:
+            return await self.cache.get_or_fetch(
+                ('user', user_id),
+                lambda: self._fetch_user_data(user_id),
+                self.user_cache_ttl
+            )
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
+    async def _fetch_user_data(self, user_id: int) -> dict:
+        return _user_data(await self.bot.fetch_user(user_id))
+
     async def fetch_member_data(self, guild_id: int, user_id: int) -> Optional[dict]:
+        guild = self.bot.get_guild(guild_id)
+        if not guild:
+            return None
+
+        member = guild.get_member(user_id)
+        if member is not None:
+            return _member_data(member)
+
         try:
-            guild = self.bot.get_guild(guild_id)
-            if not guild:
-                return None
-            member = await guild.fetch_member(user_id)
-            return {
-                'id': str(member.id),
-                'name': member.name,
-                'nick': member.nick,
-                'roles': [str(role.id) for role in member.roles],
-                'joined_at': member.joined_at.isoformat() if member.joined_at else None,
-                'premium_since': member.premium_since.isoformat() if member.premium_since else None
-            }
-        except:
+            return await self.cache.get_or_fetch(
+                ('member', guild_id, user_id),
+                lambda: self._fetch_member_data(guild, user_id),
+                self.member_cache_ttl
+            )
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
+    async def _fetch_member_data(self, guild: discord.Guild, user_id: int) -> dict:
+        return _member_data(await guild.fetch_member(user_id))
+
+    async def fetch_members_data(self, guild_id: int, user_ids: Iterable[int], chunk_size: int = 100) -> Dict[int, Optional[dict]]:
+        guild = self.bot.get_guild(guild_id)
+        if not guild:
+            return {}
+
+        results = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            member = guild.get_member(user_id)
+            if member is not None:
+                results[user_id] = _member_data(member)
+                continue
+            cached = self.cache.get(('member', guild_id, user_id))
+            if cached is not None:
+                results[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        for index in range(0, len(missing), chunk_size):
+            chunk = missing[index:index + chunk_size]
+            try:
+                members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+            except discord.ClientException:
+                members = None
+            except Exception as error:
+                metrics.record_error(error)
+                members = None
+
+            if members is None:
+                fetched = await asyncio.gather(*(self.fetch_member_data(guild_id, user_id) for user_id in chunk))
+                results.update(zip(chunk, fetched))
+                continue
+
+            for member in members:
+                data = results[member.id] = _member_data(member)
+                self.cache.set(('member', guild_id, member.id), data, self.member_cache_ttl)
+            for user_id in chunk:
+                results.setdefault(user_id, None)
+
+        return results
+
+    def invalidate_member(self, guild_id: int, user_id: int) -> None:
+        self.cache.invalidate(('member', guild_id, user_id))
+
     async def create_role(self, guild: discord.Guild, **kwargs) -> Optional[discord.Role]:
         try:
             return await guild.create_role(**kwargs)
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
     async def edit_role(self, role: discord.Role, **kwargs) -> bool:
         try:
             await role.edit(**kwargs)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
 
     async def bulk_delete_messages(self, channel: discord.TextChannel, messages: List[discord.Message]) -> bool:
-        try:
-            await channel.delete_messages(messages)
-            return True
-        except:
-            return False
+        result = await self._delete_messages(channel, messages)
+        return result['failed'] == 0
+
+    async def _delete_messages(self, channel: discord.TextChannel, messages, concurrency: int = 3) -> Dict:
+        started = time.monotonic()
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=14) + datetime.timedelta(minutes=1)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = {}
+        singles = []
+        chunk = []
+        
+        async def delete_chunk(chunk: List[discord.Message]) -> None:
+            try:
+                await channel.delete_messages(chunk)
+                ok = True
+            except discord.HTTPException:
+                ok = False
+            results.update((message.id, ok) for message in chunk)
+            
+        async def delete_single(message: discord.Message) -> None:
+            try:
+                await message.delete()
+                results[message.id] = True
+            except discord.NotFound:
+                results[message.id] = True
+            except discord.HTTPException:
+                results[message.id] = False
+            finally:
+                semaphore.release()
+                
+        if not hasattr(messages, '__aiter__'):
+            messages = _iterate(messages)
+        async for message in messages:
+            if message.created_at < cutoff:
+                await semaphore.acquire()
+                singles.append(asyncio.ensure_future(delete_single(message)))
+                continue
+                
+            chunk.append(message)
+            if len(chunk) == 100:
+                await delete_chunk(chunk)
+                chunk = []
+                
+        if chunk:
+            await delete_chunk(chunk)
+        await asyncio.gather(*singles)
+        return summarize_batch(results, started)
+
+    async def purge_messages(
+        self,
+        channel: discord.TextChannel,
+        limit: Optional[int] = 100,
+        check=None,
+        before=None,
+        after=None,
+        concurrency: int = 3
+    ) -> Dict:
+        async def stream():
+            async for message in channel.history(limit=limit, before=before, after=after):
+                if check is None or check(message):
+                    yield message
+                    
+        return await self._delete_messages(channel, stream(), concurrency)
 
     async def create_emoji(self, guild: discord.Guild, name: str, image_data: bytes) -> Optional[discord.Emoji]:
         try:
+            image_data = await self.prepare_emoji_image(image_data)
+            if image_data is None:
+                return None
             return await guild.create_custom_emoji(name=name, image=image_data)
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
-    async def fetch_emoji(self, url: str) -> Optional[bytes]:
-        async with self.session.get(url) as response:
-            if response.status == 200:
-                return await response.read()
+    async def prepare_emoji_image(self, image_data: bytes) -> Optional[bytes]:
+        if len(image_data) <= EMOJI_MAX_BYTES:
+            return image_data
+            
+        if self._image_pool is None:
+            self._image_pool = ProcessPoolExecutor(max_workers=self.image_workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._image_pool, _shrink_image, image_data, EMOJI_MAX_BYTES)
+
+    async def fetch_emoji(self, url: str, max_bytes: int = 8 * 1024 * 1024) -> Optional[bytes]:
+        try:
+            async with self.http.get(url) as response:
+                if response.status != 200:
+                    return None
+                if response.content_length and response.content_length > max_bytes:
+                    return None
+                    
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer.extend(chunk)
+                    if len(buffer) > max_bytes:
+                        return None
+                return bytes(buffer)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             return None
 
+    async def import_emojis(
+        self,
+        guild: discord.Guild,
+        emojis: Iterable[Tuple[str, str]],
+        concurrency: int = 4,
+        download_concurrency: int = 8
+    ) -> Dict[str, Optional[discord.Emoji]]:
+        download_semaphore = asyncio.Semaphore(download_concurrency)
+        upload_semaphore = asyncio.Semaphore(concurrency)
+        uploads = {}
+        
+        async def import_one(name: str, url: str) -> Tuple[str, Optional[discord.Emoji]]:
+            async with download_semaphore:
+                data = await self.fetch_emoji(url)
+            if data is None:
+                return name, None
+                
+            digest = hashlib.sha256(data).digest()
+            if digest in uploads:
+                return name, await asyncio.shield(uploads[digest])
+                
+            uploads[digest] = asyncio.get_running_loop().create_future()
+            emoji = None
+            try:
+                data = await self.prepare_emoji_image(data)
+                if data is not None:
+                    async with upload_semaphore:
+                        emoji = await self.create_emoji(guild, name, data)
+            finally:
+                uploads[digest].set_result(emoji)
+            return name, emoji
+            
+        results = await asyncio.gather(*(import_one(name, url) for name, url in dict(emojis).items()))
+        return dict(results)
+
     async def move_member(self, member: discord.Member, channel: discord.VoiceChannel) -> bool:
         try:
             await member.move_to(channel)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
 
-    async def get_audit_logs(self, guild: discord.Guild, limit: int = 100, action: discord.AuditLogAction = None) -> List[discord.AuditLogEntry]:
+    async def iter_audit_logs(
+        self,
+        guild: discord.Guild,
+        limit: Optional[int] = 100,
+        action: discord.AuditLogAction = None,
+        user: discord.abc.Snowflake = None,
+        before=None,
+        after=None,
+        oldest_first: Optional[bool] = None
+    ) -> AsyncIterator[discord.AuditLogEntry]:
+        kwargs = {'limit': limit}
+        for name, value in (('action', action), ('user', user), ('before', before), ('after', after), ('oldest_first', oldest_first)):
+            if value is not None:
+                kwargs[name] = value
+
+        async for entry in guild.audit_logs(**kwargs):
+            yield entry
+
+    async def get_audit_logs(
+        self,
+        guild: discord.Guild,
+        limit: int = 100,
+        action: discord.AuditLogAction = None,
+        user: discord.abc.Snowflake = None
+    ) -> List[discord.AuditLogEntry]:
         try:
-            entries = []
-            async for entry in guild.audit_logs(limit=limit, action=action):
-                entries.append(entry)
-            return entries
-        except:
+            return [entry async for entry in self.iter_audit_logs(guild, limit=limit, action=action, user=user)]
+        except Exception as error:
+            metrics.record_error(error)
             return []
 
+    async def get_audit_log_snapshot(
+        self,
+        guild: discord.Guild,
+        action: discord.AuditLogAction = None,
+        user: discord.abc.Snowflake = None,
+        size: int = 100
+    ) -> List[discord.AuditLogEntry]:
+        key = (guild.id, action, user.id if user else None)
+        snapshot = self._audit_snapshots.get(key)
+        if snapshot is None or snapshot.maxlen != size:
+            snapshot = self._audit_snapshots[key] = deque(maxlen=size)
+
+        after = discord.Object(id=snapshot[0].id) if snapshot else None
+        try:
+            fresh = [
+                entry async for entry in self.iter_audit_logs(
+                    guild, limit=size, action=action, user=user, after=after, oldest_first=False if after else None
+                )
+            ]
+        except Exception as error:
+            metrics.record_error(error)
+            fresh = []
+
+        for entry in reversed(fresh):
+            snapshot.appendleft(entry)
+        return list(snapshot)
+
+    async def iter_invites(
+        self,
+        guild: discord.Guild,
+        inviter: discord.abc.Snowflake = None,
+        channel: discord.abc.Snowflake = None
+    ) -> AsyncIterator[discord.Invite]:
+        for invite in await guild.invites():
+            if inviter is not None and (invite.inviter is None or invite.inviter.id != inviter.id):
+                continue
+            if channel is not None and (invite.channel is None or invite.channel.id != channel.id):
+                continue
+            yield invite
+
     async def get_invites(self, guild: discord.Guild) -> List[discord.Invite]:
         try:
             return await guild.invites()
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return []
 
     async def create_invite(self, channel: discord.TextChannel, **kwargs) -> Optional[discord.Invite]:
         try:
             return await channel.create_invite(**kwargs)
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
-    async def get_bans(self, guild: discord.Guild) -> List[discord.User]:
+    async def iter_bans(
+        self,
+        guild: discord.Guild,
+        limit: Optional[int] = None,
+        before: discord.abc.Snowflake = None,
+        after: discord.abc.Snowflake = None
+    ) -> AsyncIterator[discord.BanEntry]:
+        kwargs = {'limit': limit}
+        if before is not None:
+            kwargs['before'] = before
+        if after is not None:
+            kwargs['after'] = after
+
+        async for ban in guild.bans(**kwargs):
+            yield ban
+
+    async def get_bans(self, guild: discord.Guild, refresh: bool = False) -> List[discord.User]:
+        snapshot = self._ban_snapshots.get(guild.id)
+        if snapshot is not None and not refresh and time.monotonic() - snapshot[0] < self.ban_snapshot_ttl:
+            return list(snapshot[1].values())
+
         try:
-            bans = await guild.bans()
-            return [ban.user for ban in bans]
-        except:
+            users = {}
+            async for ban in self.iter_bans(guild):
+                users[ban.user.id] = ban.user
+            self._ban_snapshots[guild.id] = (time.monotonic(), users)
+            return list(users.values())
+        except Exception as error:
+            metrics.record_error(error)
             return []
 
+    async def is_banned(self, guild: discord.Guild, user: discord.abc.Snowflake) -> bool:
+        snapshot = self._ban_snapshots.get(guild.id)
+        if snapshot is not None and time.monotonic() - snapshot[0] < self.ban_snapshot_ttl:
+            return user.id in snapshot[1]
+
+        try:
+            await guild.fetch_ban(user)
+            return True
+        except discord.NotFound:
+            return False
+        except Exception as error:
+            metrics.record_error(error)
+            return False
+
+    def handle_member_ban(self, guild: discord.Guild, user: discord.User) -> None:
+        snapshot = self._ban_snapshots.get(guild.id)
+        if snapshot is not None:
+            snapshot[1][user.id] = user
+
+    def handle_member_unban(self, guild: discord.Guild, user: discord.User) -> None:
+        snapshot = self._ban_snapshots.get(guild.id)
+        if snapshot is not None:
+            snapshot[1].pop(user.id, None)
+
     async def get_webhooks(self, channel: discord.TextChannel) -> List[discord.Webhook]:
         try:
             return await channel.webhooks()
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return []
 
     async def create_webhook(self, channel: discord.TextChannel, name: str) -> Optional[discord.Webhook]:
         try:
             return await channel.create_webhook(name=name)
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
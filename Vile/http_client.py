@@ -0,0 +1,207 @@
+import aiohttp
+import asyncio
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+from .instrumentation import metrics
+
+_ID_SEGMENT = re.compile(r'/\d+')
+
+class _RateLimitBucket:
+    __slots__ = ('remaining', 'reset_at')
+
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+
+class HTTPClient:
+    _shared = None
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        total_timeout: float = 30,
+        connect_timeout: float = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session = None
+        self._buckets = {}
+        self._global_reset_at = 0.0
+        self._in_flight = 0
+        self._queued = 0
+        self._requests = 0
+        self._retries = 0
+        self._rate_limited = 0
+
+    @classmethod
+    def shared(cls) -> 'HTTPClient':
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def route_for(method: str, url: str) -> str:
+        parts = urlsplit(url)
+        return f"{method} {parts.netloc}{_ID_SEGMENT.sub('/{id}', parts.path)}"
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _wait_for_bucket(self, bucket: _RateLimitBucket) -> None:
+        while True:
+            now = time.monotonic()
+            delay = self._global_reset_at - now
+            if bucket.remaining is not None and bucket.remaining <= 0:
+                delay = max(delay, bucket.reset_at - now)
+            if delay <= 0:
+                break
+
+            self._queued += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._queued -= 1
+
+        if bucket.remaining is not None:
+            if bucket.reset_at <= time.monotonic():
+                bucket.remaining = None
+            else:
+                bucket.remaining -= 1
+
+    def _update_bucket(self, bucket: _RateLimitBucket, response: aiohttp.ClientResponse) -> Optional[float]:
+        headers = response.headers
+        now = time.monotonic()
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After') or headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset_after is not None:
+            try:
+                reset_after = float(reset_after)
+                if reset_after > 1e9:
+                    reset_after -= time.time()
+                bucket.remaining = int(float(remaining))
+                bucket.reset_at = now + reset_after
+            except ValueError:
+                pass
+
+        if response.status != 429:
+            return None
+
+        self._rate_limited += 1
+        try:
+            retry_after = float(headers.get('Retry-After', 1))
+        except ValueError:
+            retry_after = 1.0
+        if headers.get('X-RateLimit-Global', '').lower() == 'true':
+            self._global_reset_at = now + retry_after
+        else:
+            bucket.remaining = 0
+            bucket.reset_at = now + retry_after
+        return retry_after
+
+    @asynccontextmanager
+    async def request(
+        self,
+        method: str,
+        url: str,
+        route: Optional[str] = None,
+        retry: Optional[bool] = None,
+        **kwargs
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        route = route or self.route_for(method, url)
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = _RateLimitBucket()
+        if retry is None:
+            retry = method.upper() in self.IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            await self._wait_for_bucket(bucket)
+            self._requests += 1
+            self._in_flight += 1
+            started = time.perf_counter()
+            delay = None
+            try:
+                try:
+                    response = await self.session.request(method, url, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                    if metrics.enabled:
+                        metrics.observe_route(route, time.perf_counter() - started)
+                    if attempt >= self.max_retries or not (retry or isinstance(error, aiohttp.ClientConnectorError)):
+                        raise
+                    delay = self._backoff(attempt)
+                else:
+                    if metrics.enabled:
+                        metrics.observe_route(route, time.perf_counter() - started, response.status)
+                    retry_after = self._update_bucket(bucket, response)
+                    if response.status in self.RETRY_STATUSES and attempt < self.max_retries and (retry or response.status == 429):
+                        response.release()
+                        delay = 0 if retry_after is not None else self._backoff(attempt)
+                    else:
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+            finally:
+                self._in_flight -= 1
+
+            if delay:
+                await asyncio.sleep(delay)
+            attempt += 1
+            self._retries += 1
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'requests': self._requests,
+            'retries': self._retries,
+            'rate_limited': self._rate_limited,
+            'in_flight': self._in_flight,
+            'queued': self._queued,
+            'pool_limit': self.limit,
+            'pool_saturation': self._in_flight / self.limit if self.limit else 0.0,
+            'buckets': len(self._buckets)
+        }
@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import inspect
+import json
+import sys
+import time
+import tracemalloc
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'errors')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, value: float, error: bool = False) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'sum': self.total,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], self.counts))
+        }
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.methods = {}
+        self.routes = {}
+        self.errors = {}
+        self.loop_lag = Histogram()
+        self._loop_monitor = None
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.stop_loop_monitor()
+
+    def reset(self) -> None:
+        self.methods = {}
+        self.routes = {}
+        self.errors = {}
+        self.loop_lag = Histogram()
+
+    def observe(self, name: str, seconds: float, error: bool = False) -> None:
+        histogram = self.methods.get(name)
+        if histogram is None:
+            histogram = self.methods[name] = Histogram()
+        histogram.observe(seconds, error)
+
+    def observe_route(self, route: str, seconds: float, status: Optional[int] = None) -> None:
+        histogram = self.routes.get(route)
+        if histogram is None:
+            histogram = self.routes[route] = Histogram()
+        histogram.observe(seconds, status is None or status >= 400)
+
+    def record_error(self, error: BaseException) -> None:
+        if not self.enabled:
+            return
+        code = sys._getframe(1).f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        key = f"{name}:{type(error).__name__}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    async def _timed(self, name: str, coro):
+        started = time.perf_counter()
+        try:
+            result = await coro
+        except Exception:
+            self.observe(name, time.perf_counter() - started, True)
+            raise
+        self.observe(name, time.perf_counter() - started)
+        return result
+
+    def start_loop_monitor(self, interval: float = 0.5) -> None:
+        if self._loop_monitor is None or self._loop_monitor.done():
+            self._loop_monitor = asyncio.ensure_future(self._monitor_loop(interval))
+
+    def stop_loop_monitor(self) -> None:
+        if self._loop_monitor is not None:
+            self._loop_monitor.cancel()
+            self._loop_monitor = None
+
+    async def _monitor_loop(self, interval: float) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(time.perf_counter() - started - interval, 0.0))
+
+    def snapshot(self) -> Dict:
+        return {
+            'methods': {name: histogram.to_dict() for name, histogram in self.methods.items()},
+            'routes': {route: histogram.to_dict() for route, histogram in self.routes.items()},
+            'errors': dict(self.errors),
+            'event_loop_lag': self.loop_lag.to_dict()
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+        self._prometheus_histograms(lines, 'vile_method_latency_seconds', 'method', self.methods)
+        self._prometheus_histograms(lines, 'vile_route_latency_seconds', 'route', self.routes)
+        self._prometheus_histograms(lines, 'vile_event_loop_lag_seconds', None, {None: self.loop_lag})
+
+        lines.append('# TYPE vile_errors_total counter')
+        for key, count in self.errors.items():
+            lines.append(f'vile_errors_total{{source="{_escape(key)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _prometheus_histograms(lines: List[str], metric: str, label: Optional[str], histograms: Dict) -> None:
+        lines.append(f'# TYPE {metric} histogram')
+        for name, histogram in histograms.items():
+            labels = f'{label}="{_escape(name)}",' if label else ''
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            plain = f'{{{labels.rstrip(",")}}}' if labels else ''
+            lines.append(f'{metric}_sum{plain} {histogram.total}')
+            lines.append(f'{metric}_count{plain} {histogram.count}')
+            if label:
+                lines.append(f'{metric.replace("_latency_seconds", "")}_errors_total{plain} {histogram.errors}')
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+
+class Benchmark:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = None
+        self.elapsed = 0.0
+        self.memory_growth = 0
+        self._was_enabled = False
+        self._was_tracing = False
+        self._memory_start = 0
+
+    def __enter__(self) -> 'Benchmark':
+        self._was_enabled = metrics.enabled
+        metrics.reset()
+        metrics.enable()
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start()
+        self._memory_start = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self.memory_growth = tracemalloc.get_traced_memory()[0] - self._memory_start
+        if not self._was_tracing:
+            tracemalloc.stop()
+        if not self._was_enabled:
+            metrics.enabled = False
+
+    def result(self, events: int) -> Dict:
+        rest_calls = sum(histogram.count for histogram in metrics.routes.values())
+        return {
+            'name': self.name,
+            'events': events,
+            'elapsed': self.elapsed,
+            'throughput': events / self.elapsed if self.elapsed > 0 else float(events),
+            'rest_calls_per_event': rest_calls / events if events else 0.0,
+            'memory_growth': self.memory_growth,
+            'handlers': {
+                name: {'p50': histogram.quantile(0.5), 'p99': histogram.quantile(0.99), 'count': histogram.count}
+                for name, histogram in metrics.methods.items()
+            }
+        }
+
+def save_baseline(path: str, results: List[Dict]) -> None:
+    with open(path, 'w') as file:
+        json.dump({result['name']: result for result in results}, file, indent=2)
+
+def compare_baseline(path: str, results: List[Dict], tolerance: float = 0.1) -> List[str]:
+    with open(path) as file:
+        baseline = json.load(file)
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            continue
+        if result['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{result['name']}: throughput {result['throughput']:.0f}/s < {previous['throughput']:.0f}/s")
+        if 'rest_calls_per_event' in result and 'rest_calls_per_event' in previous:
+            if result['rest_calls_per_event'] > previous['rest_calls_per_event'] * (1 + tolerance):
+                regressions.append(f"{result['name']}: REST calls/event {result['rest_calls_per_event']:.2f} > {previous['rest_calls_per_event']:.2f}")
+        if 'memory_growth' in result and 'memory_growth' in previous:
+            if result['memory_growth'] > max(previous['memory_growth'], 0) * (1 + tolerance) + 65536:
+                regressions.append(f"{result['name']}: memory growth {result['memory_growth']} > {previous['memory_growth']}")
+        for name, handler in result.get('handlers', {}).items():
+            before = previous.get('handlers', {}).get(name)
+            if not before or before['p99'] is None or handler['p99'] is None:
+                continue
+            limit = before['p99'] * (1 + tolerance)
+            position = bisect_right(LATENCY_BUCKETS, before['p99'])
+            if position < len(LATENCY_BUCKETS):
+                limit = max(limit, LATENCY_BUCKETS[position])
+            if handler['p99'] > limit:
+                regressions.append(f"{result['name']}: {name} p99 {handler['p99']}s > {before['p99']}s")
+    return regressions
+
+def instrumented(func, name: Optional[str] = None):
+    name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return func(*args, **kwargs)
+        return metrics._timed(name, func(*args, **kwargs))
+
+    marker = getattr(asyncio.coroutines, '_is_coroutine', None)
+    if marker is not None:
+        wrapper._is_coroutine = marker
+    if hasattr(inspect, 'markcoroutinefunction'):
+        inspect.markcoroutinefunction(wrapper)
+    return wrapper
+
+def instrument_class(cls):
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith('_') and inspect.iscoroutinefunction(value):
+            setattr(cls, attr, instrumented(value))
+    return cls
+
+def instrument_discord_http(bot) -> None:
+    http = bot.http
+    if getattr(http.request, '_vile_instrumented', False):
+        return
+    request = http.request
+
+    async def timed_request(route, *args, **kwargs):
+        if not metrics.enabled:
+            return await request(route, *args, **kwargs)
+        key = f"{route.method} {route.path}"
+        started = time.perf_counter()
+        try:
+            result = await request(route, *args, **kwargs)
+        except Exception as error:
+            metrics.observe_route(key, time.perf_counter() - started, getattr(error, 'status', None))
+            raise
+        metrics.observe_route(key, time.perf_counter() - started, 200)
+        return result
+
+    timed_request._vile_instrumented = True
+    http.request = timed_request
@@ -0,0 +1,150 @@
+import asyncio
+import heapq
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+from .storage import Storage
+from .instrumentation import metrics
+
+class LeftRoleStore:
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        retention: float = 30 * 86400,
+        max_entries: int = 200000,
+        compact_interval: float = 3600
+    ):
+        self.storage = storage or Storage()
+        self.retention = retention
+        self.max_entries = max_entries
+        self.compact_interval = compact_interval
+        self._guilds = {}
+        self._spilled_guilds = set()
+        self._expire_task = None
+        self._size = 0
+        self._last_compaction = time.time()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _guild_key(guild_id) -> str:
+        return sys.intern(str(guild_id))
+
+    def _insert(self, guild_key: str, user_id: int, left_at: float, role_ids: Iterable[int]) -> None:
+        entries = self._guilds.get(guild_key)
+        if entries is None:
+            entries = self._guilds[guild_key] = {}
+        if user_id not in entries:
+            self._size += 1
+        entries[user_id] = (left_at, array('Q', role_ids))
+
+    def put(self, guild_id, user_id: int, role_ids: Iterable[int]) -> None:
+        guild_key = self._guild_key(guild_id)
+        user_id = int(user_id)
+        left_at = time.time()
+        role_ids = list(role_ids)
+
+        self._insert(guild_key, user_id, left_at, role_ids)
+        self.storage.set('left_roles', guild_key, user_id, {'roles': role_ids, 'left_at': left_at})
+
+        if self._size > self.max_entries or left_at - self._last_compaction >= self.compact_interval:
+            self.compact(left_at)
+
+    async def pop(self, guild_id, user_id: int) -> List[int]:
+        guild_key = self._guild_key(guild_id)
+        user_id = int(user_id)
+
+        entry = None
+        entries = self._guilds.get(guild_key)
+        if entries and user_id in entries:
+            entry = entries.pop(user_id)
+            self._size -= 1
+            if not entries:
+                del self._guilds[guild_key]
+        elif guild_key in self._spilled_guilds:
+            data = await self.storage.get('left_roles', guild_key, user_id)
+            if data:
+                entry = (data['left_at'], data['roles'])
+
+        if entry is None:
+            return []
+
+        self.storage.delete('left_roles', guild_key, user_id)
+        if time.time() - entry[0] > self.retention:
+            return []
+        return list(entry[1])
+
+    def compact(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        cutoff = now - self.retention
+
+        for guild_key, entries in list(self._guilds.items()):
+            expired = [user_id for user_id, (left_at, _) in entries.items() if left_at < cutoff]
+            for user_id in expired:
+                del entries[user_id]
+                self.storage.delete('left_roles', guild_key, user_id)
+            self._size -= len(expired)
+            if not entries:
+                del self._guilds[guild_key]
+
+        if self._size > self.max_entries:
+            excess = self._size - int(self.max_entries * 0.9)
+            oldest = heapq.nsmallest(
+                excess,
+                (
+                    (left_at, guild_key, user_id)
+                    for guild_key, entries in self._guilds.items()
+                    for user_id, (left_at, _) in entries.items()
+                )
+            )
+            for left_at, guild_key, user_id in oldest:
+                entries = self._guilds[guild_key]
+                del entries[user_id]
+                self._spilled_guilds.add(guild_key)
+                if not entries:
+                    del self._guilds[guild_key]
+            self._size -= len(oldest)
+
+        if self._spilled_guilds and (self._expire_task is None or self._expire_task.done()):
+            try:
+                self._expire_task = asyncio.get_running_loop().create_task(self._expire_spilled(cutoff))
+            except RuntimeError:
+                pass
+
+        self._last_compaction = now
+
+    async def _expire_spilled(self, cutoff: float) -> None:
+        try:
+            await self.storage.expire('left_roles', 'left_at', cutoff)
+        except Exception as error:
+            metrics.record_error(error)
+
+    async def load(self) -> None:
+        self._guilds = {}
+        self._spilled_guilds = set()
+        self._size = 0
+        now = time.time()
+        await self.storage.expire('left_roles', 'left_at', now - self.retention)
+
+        for guild_id, entries in (await self.storage.load('left_roles')).items():
+            guild_key = self._guild_key(guild_id)
+            for user_id, data in entries.items():
+                if isinstance(data, list):
+                    data = {'roles': data, 'left_at': now}
+                if now - data['left_at'] > self.retention:
+                    self.storage.delete('left_roles', guild_key, user_id)
+                    continue
+                self._insert(guild_key, int(user_id), data['left_at'], data['roles'])
+
+        self.compact(now)
+
+    def memory_usage(self) -> Dict[str, int]:
+        usage = {}
+        for guild_key, entries in self._guilds.items():
+            size = sys.getsizeof(entries)
+            for user_id, entry in entries.items():
+                size += sys.getsizeof(user_id) + sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+            usage[guild_key] = size
+        return usage
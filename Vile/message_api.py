@@ -2,110 +2,494 @@ import discord
 from discord.ext import commands
 from typing import List, Optional, Union, Dict
 import asyncio
+import datetime
 import json
 import re
+import time
+from collections import OrderedDict, deque
+from .storage import Storage
+from .instrumentation import instrument_class, metrics
 
+class _SpamTracker:
+    __slots__ = ('messages', 'last_hash', 'duplicates', 'mentions', 'mention_total', 'last_seen')
+    
+    def __init__(self, message_limit: int):
+        self.messages = deque(maxlen=message_limit)
+        self.last_hash = None
+        self.duplicates = 0
+        self.mentions = deque()
+        self.mention_total = 0
+        self.last_seen = 0.0
+
+class _AfkRecord:
+    __slots__ = ('reason', 'since')
+    
+    def __init__(self, reason: str, since: float):
+        self.reason = reason
+        self.since = since
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    if seconds or not parts:
+        parts.append(f"{seconds}s")
+    return ' '.join(parts[:2])
+
+class _GuildPipeline:
+    __slots__ = ('guild_key', 'matcher', 'responders', 'spam')
+    
+    def __init__(self, guild_key: str, responders: Optional[Dict], spam: Optional[Dict]):
+        self.guild_key = guild_key
+        self.responders = responders
+        self.matcher = None
+        self.spam = spam
+
+def _join_messages(parts: List[str], limit: int = 2000) -> List[str]:
+    chunks = []
+    current = ''
+    for part in parts:
+        if current and len(current) + len(part) + 1 > limit:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+class _SnipeRecord:
+    __slots__ = ('content', 'before', 'author_id', 'author_name', 'guild_id', 'attachments', 'timestamp', 'stored_at')
+    
+    def __init__(self, message: discord.Message, content: str, before: Optional[str] = None, attachments: tuple = ()):
+        self.content = content
+        self.before = before
+        self.author_id = message.author.id
+        self.author_name = str(message.author)
+        self.guild_id = message.guild.id if message.guild else None
+        self.attachments = attachments
+        self.timestamp = message.created_at
+        self.stored_at = time.monotonic()
+
+class _SnipeStore:
+    def __init__(self, depth: int, max_entries: int, ttl: float):
+        self.depth = depth
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._channels = OrderedDict()
+        self._size = 0
+        
+    def __len__(self) -> int:
+        return self._size
+        
+    def push(self, channel_id: str, record: _SnipeRecord) -> None:
+        history = self._channels.get(channel_id)
+        if history is None:
+            history = deque(maxlen=self.depth)
+            self._channels[channel_id] = history
+        else:
+            self._channels.move_to_end(channel_id)
+            
+        if len(history) < self.depth:
+            self._size += 1
+        history.appendleft(record)
+        self._evict(record.stored_at)
+        
+    def get(self, channel_id: str, index: int = 0) -> Optional[_SnipeRecord]:
+        history = self._channels.get(channel_id)
+        if history is None:
+            return None
+            
+        expiry = time.monotonic() - self.ttl
+        while history and history[-1].stored_at < expiry:
+            history.pop()
+            self._size -= 1
+        if not history:
+            del self._channels[channel_id]
+            return None
+            
+        self._channels.move_to_end(channel_id)
+        if 0 <= index < len(history):
+            return history[index]
+        return None
+        
+    def _evict(self, now: float) -> None:
+        expiry = now - self.ttl
+        while self._channels:
+            channel_id, history = next(iter(self._channels.items()))
+            if self._size <= self.max_entries and history[0].stored_at >= expiry:
+                break
+            self._size -= len(history)
+            del self._channels[channel_id]
+
+class _AutoresponderMatcher:
+    __slots__ = ('_triggers', '_patterns', '_goto', '_fail', '_out', '_always')
+    
+    SCAN_THRESHOLD = 200
+    
+    def __init__(self, triggers: List[str]):
+        self._triggers = list(triggers)
+        self._patterns = None
+        self._goto = [{}]
+        self._out = [()]
+        self._always = []
+        
+        if len(self._triggers) < self.SCAN_THRESHOLD:
+            self._patterns = [(trigger, trigger.lower()) for trigger in self._triggers]
+            return
+            
+        for index, trigger in enumerate(self._triggers):
+            pattern = trigger.lower()
+            if not pattern:
+                self._always.append(index)
+                continue
+                
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (index,)
+            
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] += self._out[self._fail[next_state]]
+                queue.append(next_state)
+                
+    def match(self, content: str) -> List[str]:
+        if self._patterns is not None:
+            return [trigger for trigger, pattern in self._patterns if pattern in content]
+            
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set(self._always)
+        state = 0
+        
+        for char in content:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+                
+        return [self._triggers[index] for index in sorted(found)]
+
+@instrument_class
 class MessageAPI:
-    def __init__(self, bot):
+    def __init__(self, bot, storage: Optional[Storage] = None, snipe_depth: int = 5, snipe_limit: int = 20000, snipe_ttl: float = 3600):
         self.bot = bot
-        self._snipe_messages = {}
-        self._edit_snipe_messages = {}
+        self.storage = storage or Storage()
+        self._snipe_messages = _SnipeStore(snipe_depth, snipe_limit, snipe_ttl)
+        self._edit_snipe_messages = _SnipeStore(snipe_depth, snipe_limit, snipe_ttl)
         self._afk_users = {}
+        self._afk_notices = {}
+        self.afk_notice_cooldown = 30
         self._spam_settings = {}
         self._autoresponders = {}
+        self._pipelines = {}
+        self._spam_trackers = OrderedDict()
+        self.spam_tracker_limit = 50000
+        self.spam_idle_timeout = 300
         
+    async def load_state(self) -> None:
+        self._autoresponders = await self.storage.load('autoresponders')
+        self._spam_settings = {
+            guild_id: data['settings']
+            for guild_id, data in (await self.storage.load('spam_settings')).items()
+        }
+        
+        self._pipelines = {}
+        for guild_id in {*self._autoresponders, *self._spam_settings}:
+            self._compile_pipeline(guild_id)
+        
+        self._afk_users = {}
+        for user_id, afk_data in (await self.storage.load('afk')).get('', {}).items():
+            self._afk_users[int(user_id)] = _AfkRecord(
+                afk_data['reason'],
+                datetime.datetime.fromisoformat(afk_data['timestamp']).timestamp()
+            )
+            
+    def _compile_pipeline(self, guild_id: str) -> None:
+        responders = self._autoresponders.get(guild_id) or None
+        spam = self._spam_settings.get(guild_id)
+        if spam is not None and not spam.get('enabled', False):
+            spam = None
+            
+        if responders is None and spam is None:
+            self._pipelines.pop(int(guild_id), None)
+        else:
+            self._pipelines[int(guild_id)] = _GuildPipeline(guild_id, responders, spam)
+            
     async def handle_message(self, message: discord.Message) -> None:
         if message.author.bot:
             return
             
+        afk_users = self._afk_users
+        check_afk = bool(afk_users) and (message.author.id in afk_users or bool(message.mentions))
+        pipeline = self._pipelines.get(message.guild.id) if message.guild else None
+        if pipeline is None and not check_afk:
+            return
+            
+        stages = []
+        if check_afk:
+            stages.append(self._handle_afk(message))
+        if pipeline is not None:
+            if pipeline.responders is not None:
+                stages.append(self._handle_autoresponders(message, pipeline))
+            if pipeline.spam is not None:
+                stages.append(self._check_spam(message, pipeline))
+                
+        if len(stages) == 1:
+            await stages[0]
+            return
+        errors = [result for result in await asyncio.gather(*stages, return_exceptions=True) if isinstance(result, Exception)]
+        for error in errors[1:]:
+            metrics.record_error(error)
+        if errors:
+            raise errors[0]
+                
+    async def _handle_afk(self, message: discord.Message) -> None:
+        await self._clear_returning_afk(message)
         await self._check_afk_mentions(message)
-        await self._handle_autoresponders(message)
-        await self._check_spam(message)
         
+    async def _clear_returning_afk(self, message: discord.Message) -> None:
+        record = self._afk_users.get(message.author.id)
+        if record is None or message.created_at.timestamp() <= record.since:
+            return
+            
+        self.remove_afk(message.author.id)
+        embed = discord.Embed(
+            description=f"Welcome back {message.author.mention}, you were AFK for {_format_duration(time.time() - record.since)}",
+            color=discord.Color.blue()
+        )
+        try:
+            await message.channel.send(embed=embed, delete_after=10)
+        except discord.HTTPException as error:
+            metrics.record_error(error)
+            
     async def _check_afk_mentions(self, message: discord.Message) -> None:
         if not message.mentions:
             return
             
+        afk_users = self._afk_users
+        now = time.time()
+        monotonic = time.monotonic()
+        channel_id = message.channel.id
+        lines = []
+        seen = set()
+        
         for mention in message.mentions:
-            if str(mention.id) in self._afk_users:
-                afk_data = self._afk_users[str(mention.id)]
-                embed = discord.Embed(
-                    description=f"{mention.name} is AFK: {afk_data['reason']}",
-                    color=discord.Color.blue()
-                )
-                await message.channel.send(embed=embed)
-                
-    async def _handle_autoresponders(self, message: discord.Message) -> None:
-        if not message.guild:
-            return
+            record = afk_users.get(mention.id)
+            if record is None or mention.id in seen or mention.id == message.author.id:
+                continue
+            seen.add(mention.id)
             
-        guild_id = str(message.guild.id)
-        if guild_id not in self._autoresponders:
-            return
+            key = (channel_id, mention.id)
+            if monotonic - self._afk_notices.get(key, float('-inf')) < self.afk_notice_cooldown:
+                continue
+            self._afk_notices[key] = monotonic
+            lines.append(f"{mention.name} is AFK: {record.reason} ({_format_duration(now - record.since)} ago)")
             
-        content = message.content.lower()
-        for trigger, response in self._autoresponders[guild_id].items():
-            if trigger.lower() in content:
-                await message.channel.send(response)
+        if len(self._afk_notices) > 10000:
+            self._afk_notices = {
+                key: sent for key, sent in self._afk_notices.items()
+                if monotonic - sent < self.afk_notice_cooldown
+            }
+            
+        if lines:
+            embed = discord.Embed(description='\n'.join(lines), color=discord.Color.blue())
+            await message.channel.send(embed=embed)
+            
+    async def _handle_autoresponders(self, message: discord.Message, pipeline: _GuildPipeline) -> None:
+        responders = pipeline.responders
+        matcher = pipeline.matcher
+        if matcher is None:
+            matcher = pipeline.matcher = _AutoresponderMatcher(responders)
+        responses = [responders[trigger] for trigger in matcher.match(message.content.lower())]
+        for content in _join_messages(responses):
+            await message.channel.send(content)
                 
-    async def _check_spam(self, message: discord.Message) -> None:
-        if not message.guild:
-            return
+    async def _check_spam(self, message: discord.Message, pipeline: _GuildPipeline) -> None:
+        settings = pipeline.spam
+        guild_id = pipeline.guild_key
+        now = time.monotonic()
+        key = (guild_id, message.author.id)
+        message_limit = max(settings.get('message_limit', 5), 1)
+        interval = settings.get('interval', 5)
+        
+        tracker = self._spam_trackers.get(key)
+        if tracker is None or tracker.messages.maxlen != message_limit:
+            tracker = _SpamTracker(message_limit)
+            self._spam_trackers[key] = tracker
+        else:
+            self._spam_trackers.move_to_end(key)
+        tracker.last_seen = now
+        self._evict_spam_trackers(now)
+        
+        previous = tracker.messages[-1] if tracker.messages else None
+        tracker.messages.append(now)
+        reason = None
+        if len(tracker.messages) == message_limit and now - tracker.messages[0] <= interval:
+            reason = "Sending messages too quickly"
             
-        guild_id = str(message.guild.id)
-        if guild_id not in self._spam_settings:
-            return
+        content_hash = hash(message.content.strip().lower())
+        if content_hash == tracker.last_hash and previous is not None and now - previous <= interval:
+            tracker.duplicates += 1
+        else:
+            tracker.last_hash = content_hash
+            tracker.duplicates = 1
+        if reason is None and tracker.duplicates >= settings.get('duplicate_limit', 3):
+            reason = "Sending duplicate messages"
+            
+        mention_count = len(message.raw_mentions) + len(message.raw_role_mentions)
+        if message.mention_everyone:
+            mention_count += 1
+        while tracker.mentions and now - tracker.mentions[0][0] > interval:
+            tracker.mention_total -= tracker.mentions.popleft()[1]
+        if mention_count:
+            tracker.mentions.append((now, mention_count))
+            tracker.mention_total += mention_count
+        if reason is None and tracker.mention_total >= settings.get('mention_limit', 5):
+            reason = "Mass mentioning"
+            
+        if reason is not None:
+            await self._handle_spam(message, settings, tracker, reason)
             
-        settings = self._spam_settings[guild_id]
-        if not settings.get('enabled', False):
+    def _evict_spam_trackers(self, now: float) -> None:
+        trackers = self._spam_trackers
+        while trackers:
+            key, tracker = next(iter(trackers.items()))
+            if len(trackers) <= self.spam_tracker_limit and now - tracker.last_seen < self.spam_idle_timeout:
+                break
+            del trackers[key]
+            
+    async def _handle_spam(self, message: discord.Message, settings: Dict, tracker: _SpamTracker, reason: str) -> None:
+        action = settings.get('action', 'delete')
+        
+        try:
+            await message.delete()
+        except discord.HTTPException as error:
+            metrics.record_error(error)
+            
+        if action == 'delete':
             return
             
-
+        tracker.messages.clear()
+        tracker.last_hash = None
+        tracker.duplicates = 0
+        tracker.mentions.clear()
+        tracker.mention_total = 0
+        
+        try:
+            if action == 'timeout':
+                duration = datetime.timedelta(seconds=settings.get('timeout_duration', 300))
+                await message.author.timeout(duration, reason=reason)
+            elif action == 'kick':
+                await message.author.kick(reason=reason)
+            elif action == 'ban':
+                await message.author.ban(reason=reason, delete_message_days=1)
+        except discord.HTTPException as error:
+            metrics.record_error(error)
         
     async def snipe_message(self, message: discord.Message) -> None:
         channel_id = str(message.channel.id)
-        self._snipe_messages[channel_id] = {
-            'content': message.content,
-            'author': message.author,
-            'attachments': [att.url for att in message.attachments],
-            'timestamp': message.created_at
-        }
+        self._snipe_messages.push(channel_id, _SnipeRecord(
+            message,
+            message.content,
+            attachments=tuple(att.url for att in message.attachments)
+        ))
         
     async def edit_snipe_message(self, before: discord.Message, after: discord.Message) -> None:
         channel_id = str(before.channel.id)
-        self._edit_snipe_messages[channel_id] = {
-            'before': before.content,
-            'after': after.content,
-            'author': before.author,
-            'timestamp': before.created_at
-        }
+        self._edit_snipe_messages.push(channel_id, _SnipeRecord(
+            before,
+            after.content,
+            before=before.content
+        ))
         
-    def get_snipe(self, channel_id: str) -> Optional[Dict]:
-        return self._snipe_messages.get(channel_id)
+    def _resolve_author(self, record: _SnipeRecord) -> Optional[Union[discord.Member, discord.User]]:
+        if record.guild_id:
+            guild = self.bot.get_guild(record.guild_id)
+            member = guild.get_member(record.author_id) if guild else None
+            if member:
+                return member
+        return self.bot.get_user(record.author_id)
         
-    def get_edit_snipe(self, channel_id: str) -> Optional[Dict]:
-        return self._edit_snipe_messages.get(channel_id)
+    def get_snipe(self, channel_id: str, index: int = 0) -> Optional[Dict]:
+        record = self._snipe_messages.get(channel_id, index)
+        if record is None:
+            return None
+        return {
+            'content': record.content,
+            'author': self._resolve_author(record),
+            'author_id': record.author_id,
+            'author_name': record.author_name,
+            'attachments': list(record.attachments),
+            'timestamp': record.timestamp
+        }
         
-    async def set_afk(self, user_id: str, reason: str) -> None:
-        self._afk_users[user_id] = {
-            'reason': reason,
-            'timestamp': discord.utils.utcnow()
+    def get_edit_snipe(self, channel_id: str, index: int = 0) -> Optional[Dict]:
+        record = self._edit_snipe_messages.get(channel_id, index)
+        if record is None:
+            return None
+        return {
+            'before': record.before,
+            'after': record.content,
+            'author': self._resolve_author(record),
+            'author_id': record.author_id,
+            'author_name': record.author_name,
+            'timestamp': record.timestamp
         }
         
-    def remove_afk(self, user_id: str) -> None:
-        self._afk_users.pop(user_id, None)
+    async def set_afk(self, user_id: Union[int, str], reason: str) -> None:
+        timestamp = discord.utils.utcnow()
+        self._afk_users[int(user_id)] = _AfkRecord(reason, timestamp.timestamp())
+        self.storage.set('afk', '', user_id, {'reason': reason, 'timestamp': timestamp.isoformat()})
         
-    def is_afk(self, user_id: str) -> bool:
-        return user_id in self._afk_users
+    def remove_afk(self, user_id: Union[int, str]) -> None:
+        if self._afk_users.pop(int(user_id), None) is not None:
+            self.storage.delete('afk', '', user_id)
+        
+    def is_afk(self, user_id: Union[int, str]) -> bool:
+        return int(user_id) in self._afk_users
+        
+    def get_afk(self, user_id: Union[int, str]) -> Optional[Dict]:
+        record = self._afk_users.get(int(user_id))
+        if record is None:
+            return None
+        return {
+            'reason': record.reason,
+            'timestamp': datetime.datetime.fromtimestamp(record.since, datetime.timezone.utc),
+            'duration': time.time() - record.since
+        }
         
     async def add_autoresponder(self, guild_id: str, trigger: str, response: str) -> None:
         if guild_id not in self._autoresponders:
             self._autoresponders[guild_id] = {}
         self._autoresponders[guild_id][trigger] = response
+        self._compile_pipeline(guild_id)
+        self.storage.set('autoresponders', guild_id, trigger, response)
         
     def remove_autoresponder(self, guild_id: str, trigger: str) -> bool:
         if guild_id in self._autoresponders:
-            return self._autoresponders[guild_id].pop(trigger, None) is not None
+            if self._autoresponders[guild_id].pop(trigger, None) is not None:
+                self._compile_pipeline(guild_id)
+                self.storage.delete('autoresponders', guild_id, trigger)
+                return True
         return False
         
     def get_autoresponders(self, guild_id: str) -> Dict:
@@ -113,6 +497,8 @@ class MessageAPI:
         
     async def set_spam_settings(self, guild_id: str, settings: Dict) -> None:
         self._spam_settings[guild_id] = settings
+        self._compile_pipeline(guild_id)
+        self.storage.set('spam_settings', guild_id, 'settings', settings)
         
     def get_spam_settings(self, guild_id: str) -> Dict:
         return self._spam_settings.get(guild_id, {})
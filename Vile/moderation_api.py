@@ -3,16 +3,152 @@ from discord.ext import commands
 from typing import List, Optional, Union, Dict
 import asyncio
 import datetime
+import heapq
+import inspect
+import time
+from .batch import run_batch, summarize_batch
+from .storage import Storage
+from .warn_ledger import EscalationRule, WarnLedger
+from .instrumentation import instrument_class, metrics
 
+@instrument_class
 class ModerationAPI:
-    def __init__(self, bot):
+    MUTE_PERMISSIONS = {
+        'send_messages': False,
+        'send_messages_in_threads': False,
+        'create_public_threads': False,
+        'create_private_threads': False,
+        'add_reactions': False,
+        'speak': False
+    }
+    
+    def __init__(self, bot, storage: Optional[Storage] = None):
         self.bot = bot
+        self.storage = storage or Storage()
         self._muted_roles = {}
         self._temp_bans = {}
         self._temp_mutes = {}
-        self._warns = {}
+        self._warns = WarnLedger(self.storage)
+        self._escalations = {}
         self._lockdowns = set()
+        self._expiry_heap = []
+        self._expiry_wakeup = asyncio.Event()
+        self._expiry_task = None
+        self.expiry_concurrency = 10
+        self.expiry_retry_delay = 30
+        self.expiry_retry_max = 3600
+        self._mute_rollouts = {}
+        self._mute_rollout_tasks = {}
         
+    async def load_state(self) -> None:
+        await self._warns.load()
+        self._escalations = {}
+        for guild_id, data in (await self.storage.load('warn_escalations')).items():
+            self._escalations[int(guild_id)] = self._order_rules(EscalationRule.from_dict(rule) for rule in data['rules'])
+        self._muted_roles = {
+            int(guild_id): data['role_id']
+            for guild_id, data in (await self.storage.load('muted_roles')).items()
+        }
+        self._lockdowns = {
+            int(channel_id)
+            for channels in (await self.storage.load('lockdowns')).values()
+            for channel_id in channels
+        }
+        self._mute_rollouts = {
+            int(guild_id): (int(role_id), set(channel_ids))
+            for guild_id, rollouts in (await self.storage.load('mute_rollouts')).items()
+            for role_id, channel_ids in rollouts.items()
+        }
+        
+        self._temp_mutes = {}
+        self._temp_bans = {}
+        self._expiry_heap = []
+        for kind, store in (('mute', self._temp_mutes), ('ban', self._temp_bans)):
+            for guild_id, entries in (await self.storage.load(f'temp_{kind}s')).items():
+                for user_id, data in entries.items():
+                    end_time = datetime.datetime.fromisoformat(data['end_time'])
+                    store[(int(guild_id), int(user_id))] = dict(
+                        data,
+                        guild_id=int(guild_id),
+                        user_id=int(user_id),
+                        end_time=end_time
+                    )
+                    self._schedule_expiry(kind, int(guild_id), int(user_id), end_time)
+                    
+    def _set_temp_punishment(self, kind: str, guild_id: int, user_id: int, duration: int, **extra) -> None:
+        store = self._temp_mutes if kind == 'mute' else self._temp_bans
+        end_time = discord.utils.utcnow() + datetime.timedelta(seconds=duration)
+        store[(guild_id, user_id)] = dict(
+            extra,
+            guild_id=guild_id,
+            user_id=user_id,
+            end_time=end_time
+        )
+        self.storage.set(f'temp_{kind}s', guild_id, user_id, dict(extra, end_time=end_time.isoformat()))
+        self._schedule_expiry(kind, guild_id, user_id, end_time)
+        
+    def _clear_temp_punishment(self, kind: str, guild_id: int, user_id: int) -> None:
+        store = self._temp_mutes if kind == 'mute' else self._temp_bans
+        if store.pop((guild_id, user_id), None) is not None:
+            self.storage.delete(f'temp_{kind}s', guild_id, user_id)
+            
+    def _schedule_expiry(self, kind: str, guild_id: int, user_id: int, end_time: datetime.datetime) -> None:
+        deadline = end_time.timestamp()
+        if self._expiry_heap and len(self._expiry_heap) > 2 * (len(self._temp_mutes) + len(self._temp_bans)) + 64:
+            self._expiry_heap = [
+                entry for entry in self._expiry_heap
+                if self._expiry_entry_live(entry)
+            ]
+            heapq.heapify(self._expiry_heap)
+            
+        earliest = self._expiry_heap[0][0] if self._expiry_heap else None
+        heapq.heappush(self._expiry_heap, (deadline, kind, guild_id, user_id))
+        
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._run_expiry_scheduler())
+        elif earliest is None or deadline < earliest:
+            self._expiry_wakeup.set()
+            
+    def _expiry_entry_live(self, entry: tuple) -> bool:
+        deadline, kind, guild_id, user_id = entry
+        store = self._temp_mutes if kind == 'mute' else self._temp_bans
+        data = store.get((guild_id, user_id))
+        return data is not None and data.get('retry_at', data['end_time'].timestamp()) == deadline
+        
+    def _retry_expiry(self, kind: str, guild_id: int, user_id: int) -> None:
+        store = self._temp_mutes if kind == 'mute' else self._temp_bans
+        data = store.get((guild_id, user_id))
+        if data is None:
+            return
+        attempts = data['attempts'] = data.get('attempts', 0) + 1
+        delay = min(self.expiry_retry_delay * 2 ** (attempts - 1), self.expiry_retry_max)
+        data['retry_at'] = discord.utils.utcnow().timestamp() + delay
+        heapq.heappush(self._expiry_heap, (data['retry_at'], kind, guild_id, user_id))
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._run_expiry_scheduler())
+        
+    async def _run_expiry_scheduler(self) -> None:
+        while self._expiry_heap:
+            try:
+                await self.check_temp_punishments()
+            except Exception as error:
+                metrics.record_error(error)
+            if not self._expiry_heap:
+                break
+                
+            delay = self._expiry_heap[0][0] - discord.utils.utcnow().timestamp()
+            self._expiry_wakeup.clear()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._expiry_wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                    
+    def stop_expiry_scheduler(self) -> None:
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+            
     async def create_mute_role(self, guild: discord.Guild) -> Optional[discord.Role]:
         try:
             mute_role = await guild.create_role(
@@ -20,27 +156,82 @@ class ModerationAPI:
                 reason="Role for muted users"
             )
             
-            for channel in guild.channels:
-                if isinstance(channel, (discord.TextChannel, discord.VoiceChannel)):
-                    await channel.set_permissions(mute_role, 
-                        speak=False, 
-                        send_messages=False,
-                        add_reactions=False
-                    )
-                    
             self._muted_roles[guild.id] = mute_role.id
+            self.storage.set('muted_roles', guild.id, 'role_id', mute_role.id)
+            
+            rollout = asyncio.ensure_future(self.apply_mute_permissions(guild, mute_role))
+            self._mute_rollout_tasks[guild.id] = rollout
+            await rollout
             return mute_role
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
             
+    async def apply_mute_permissions(self, guild: discord.Guild, role: discord.Role, concurrency: int = 5, progress=None) -> bool:
+        checkpoint = self._mute_rollouts.get(guild.id)
+        if checkpoint is None or checkpoint[0] != role.id:
+            if checkpoint is not None:
+                self.storage.delete('mute_rollouts', guild.id, checkpoint[0])
+            checkpoint = (role.id, set())
+            self._mute_rollouts[guild.id] = checkpoint
+        done = checkpoint[1]
+        
+        overwrite = discord.PermissionOverwrite(**self.MUTE_PERMISSIONS)
+        categories = list(guild.categories)
+        channels = [channel for channel in guild.channels if not isinstance(channel, discord.CategoryChannel)]
+        total = len(categories) + len(channels)
+        semaphore = asyncio.Semaphore(concurrency)
+        completed = 0
+        failed = 0
+        
+        async def apply(channel: discord.abc.GuildChannel) -> None:
+            nonlocal completed, failed
+            if channel.id not in done and channel.overwrites_for(role) != overwrite:
+                async with semaphore:
+                    try:
+                        await channel.set_permissions(role, overwrite=overwrite, reason="Configuring mute role")
+                    except discord.HTTPException:
+                        failed += 1
+                        return
+                        
+            done.add(channel.id)
+            self.storage.set('mute_rollouts', guild.id, role.id, list(done))
+            completed += 1
+            if progress is not None:
+                result = progress(completed, total)
+                if inspect.isawaitable(result):
+                    await result
+                    
+        await asyncio.gather(*(apply(category) for category in categories))
+        await asyncio.gather(*(apply(channel) for channel in channels))
+        
+        if failed:
+            return False
+        self._mute_rollouts.pop(guild.id, None)
+        self.storage.delete('mute_rollouts', guild.id, role.id)
+        return True
+        
+    def _resume_mute_rollout(self, guild: discord.Guild, role: discord.Role) -> None:
+        checkpoint = self._mute_rollouts.get(guild.id)
+        if checkpoint is None or checkpoint[0] != role.id:
+            return
+        task = self._mute_rollout_tasks.get(guild.id)
+        if task is None or task.done():
+            self._mute_rollout_tasks[guild.id] = asyncio.create_task(self.apply_mute_permissions(guild, role))
+            
     async def get_mute_role(self, guild: discord.Guild) -> Optional[discord.Role]:
         role_id = self._muted_roles.get(guild.id)
         if role_id:
-            return guild.get_role(role_id)
+            role = guild.get_role(role_id)
+            if role:
+                self._resume_mute_rollout(guild, role)
+            return role
             
         role = discord.utils.get(guild.roles, name="Muted")
         if role:
             self._muted_roles[guild.id] = role.id
+            self.storage.set('muted_roles', guild.id, 'role_id', role.id)
+            self._resume_mute_rollout(guild, role)
             return role
             
         return await self.create_mute_role(guild)
@@ -54,13 +245,11 @@ class ModerationAPI:
             await member.add_roles(mute_role, reason=reason)
             
             if duration:
-                self._temp_mutes[member.id] = {
-                    'end_time': discord.utils.utcnow() + datetime.timedelta(seconds=duration),
-                    'role_id': mute_role.id
-                }
+                self._set_temp_punishment('mute', member.guild.id, member.id, duration, role_id=mute_role.id)
                 
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
     async def unmute_member(self, member: discord.Member, reason: str = None) -> bool:
@@ -70,93 +259,222 @@ class ModerationAPI:
                 return False
                 
             await member.remove_roles(mute_role, reason=reason)
-            self._temp_mutes.pop(member.id, None)
+            self._clear_temp_punishment('mute', member.guild.id, member.id)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
-    async def warn_member(self, member: discord.Member, reason: str) -> int:
-        guild_id = str(member.guild.id)
-        user_id = str(member.id)
-        
-        if guild_id not in self._warns:
-            self._warns[guild_id] = {}
-            
-        if user_id not in self._warns[guild_id]:
-            self._warns[guild_id][user_id] = []
-            
-        warn_data = {
-            'reason': reason,
-            'timestamp': discord.utils.utcnow().isoformat(),
-            'moderator_id': self.bot.user.id
-        }
-        
-        self._warns[guild_id][user_id].append(warn_data)
-        return len(self._warns[guild_id][user_id])
-        
-    def get_warns(self, guild_id: str, user_id: str) -> List[Dict]:
-        return self._warns.get(guild_id, {}).get(user_id, [])
-        
-    def clear_warns(self, guild_id: str, user_id: str) -> bool:
-        if guild_id in self._warns and user_id in self._warns[guild_id]:
-            self._warns[guild_id][user_id] = []
-            return True
-        return False
-        
+    async def warn_member(self, member: discord.Member, reason: str, moderator: Optional[discord.abc.Snowflake] = None) -> int:
+        moderator_id = moderator.id if moderator is not None else self.bot.user.id
+        now = int(time.time())
+        count = self._warns.add(member.guild.id, member.id, moderator_id, reason, now)
+        await self._escalate(member, now)
+        return count
+
+    async def _escalate(self, member: discord.Member, now: int) -> Optional[EscalationRule]:
+        for rule in self._escalations.get(member.guild.id, ()):
+            if self._warns.count(member.guild.id, member.id, now - rule.window, now) < rule.count:
+                continue
+
+            reason = f"Escalation: {rule.count} warns within {rule.window}s"
+            try:
+                if rule.action == 'mute':
+                    await self.mute_member(member, duration=rule.duration, reason=reason)
+                elif rule.action == 'timeout':
+                    await member.timeout(datetime.timedelta(seconds=rule.duration or 3600), reason=reason)
+                elif rule.action == 'kick':
+                    await member.kick(reason=reason)
+                elif rule.action == 'ban':
+                    await self.ban_member(member, duration=rule.duration, reason=reason)
+            except Exception as error:
+                metrics.record_error(error)
+            return rule
+        return None
+
+    @staticmethod
+    def _order_rules(rules) -> List[EscalationRule]:
+        return sorted(rules, key=lambda rule: (rule.count, -rule.window), reverse=True)
+
+    def set_escalation_rules(self, guild_id: int, rules: List[EscalationRule]) -> None:
+        rules = self._order_rules(rules)
+        if rules:
+            self._escalations[guild_id] = rules
+            self.storage.set('warn_escalations', guild_id, 'rules', [rule.to_dict() for rule in rules])
+        else:
+            self._escalations.pop(guild_id, None)
+            self.storage.delete('warn_escalations', guild_id, 'rules')
+
+    def get_escalation_rules(self, guild_id: int) -> List[EscalationRule]:
+        return list(self._escalations.get(guild_id, ()))
+
+    def get_warns(self, guild_id: Union[int, str], user_id: Union[int, str]) -> List[Dict]:
+        return self._warns.get(guild_id, user_id)
+
+    def count_warns(self, guild_id: Union[int, str], user_id: Union[int, str], window: Optional[int] = None) -> int:
+        since = int(time.time()) - window if window is not None else None
+        return self._warns.count(guild_id, user_id, since)
+
+    def get_warns_between(self, guild_id: Union[int, str], since: Optional[int] = None, until: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict]:
+        return self._warns.range(guild_id, since, until, user_id)
+
+    def clear_warns(self, guild_id: Union[int, str], user_id: Union[int, str]) -> bool:
+        return self._warns.clear(guild_id, user_id)
+
     async def ban_member(self, member: discord.Member, duration: int = None, reason: str = None, delete_message_days: int = 0) -> bool:
         try:
             await member.ban(reason=reason, delete_message_days=delete_message_days)
             
             if duration:
-                self._temp_bans[member.id] = {
-                    'guild_id': member.guild.id,
-                    'end_time': discord.utils.utcnow() + datetime.timedelta(seconds=duration)
-                }
+                self._set_temp_punishment('ban', member.guild.id, member.id, duration)
                 
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
     async def unban_member(self, guild: discord.Guild, user_id: int, reason: str = None) -> bool:
         try:
             user = await self.bot.fetch_user(user_id)
             await guild.unban(user, reason=reason)
-            self._temp_bans.pop(user_id, None)
+            self._clear_temp_punishment('ban', guild.id, user_id)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
-    async def check_temp_punishments(self) -> None:
-        current_time = discord.utils.utcnow()
-        
-        for user_id, mute_data in list(self._temp_mutes.items()):
-            if current_time >= mute_data['end_time']:
-                guild = self.bot.get_guild(mute_data['guild_id'])
-                if guild:
-                    member = guild.get_member(user_id)
-                    if member:
-                        await self.unmute_member(member, reason="Temporary mute expired")
-                        
-        for user_id, ban_data in list(self._temp_bans.items()):
-            if current_time >= ban_data['end_time']:
-                guild = self.bot.get_guild(ban_data['guild_id'])
-                if guild:
-                    await self.unban_member(guild, user_id, reason="Temporary ban expired")
+    async def mass_ban(self, guild: discord.Guild, users: List[discord.abc.Snowflake], duration: int = None, reason: str = None, delete_message_days: int = 0, concurrency: int = 5) -> Dict:
+        users = list({user.id: user for user in users}.values())
+        started = time.monotonic()
+        results = {}
+        
+        if self._can_bulk_ban(guild):
+            for index in range(0, len(users), 200):
+                chunk = users[index:index + 200]
+                try:
+                    result = await guild.bulk_ban(
+                        chunk,
+                        reason=reason,
+                        delete_message_seconds=delete_message_days * 86400
+                    )
+                    results.update((user.id, True) for user in result.banned)
+                    results.update((user.id, False) for user in result.failed)
+                except discord.Forbidden as error:
+                    metrics.record_error(error)
+                    break
+                except discord.HTTPException as error:
+                    metrics.record_error(error)
+                    results.update((user.id, False) for user in chunk)
                     
+        remaining = [user for user in users if user.id not in results]
+        if remaining:
+            async def ban(user: discord.abc.Snowflake) -> bool:
+                await guild.ban(user, reason=reason, delete_message_days=delete_message_days)
+                return True
+                
+            results.update((await run_batch(remaining, ban, concurrency))['results'])
+            
+        if duration:
+            for user_id, banned in results.items():
+                if banned:
+                    self._set_temp_punishment('ban', guild.id, user_id, duration)
+        return summarize_batch(results, started)
+        
+    @staticmethod
+    def _can_bulk_ban(guild: discord.Guild) -> bool:
+        if not hasattr(guild, 'bulk_ban'):
+            return False
+        me = getattr(guild, 'me', None)
+        return me is None or me.guild_permissions.manage_guild
+        
+    async def mass_kick(self, members: List[discord.Member], reason: str = None, concurrency: int = 5) -> Dict:
+        async def kick(member: discord.Member) -> bool:
+            await member.kick(reason=reason)
+            return True
+            
+        return await run_batch(members, kick, concurrency)
+        
+    async def mass_mute(self, members: List[discord.Member], duration: int = None, reason: str = None, concurrency: int = 5) -> Dict:
+        members = list(members)
+        if members and not await self.get_mute_role(members[0].guild):
+            return summarize_batch({member.id: False for member in members}, time.monotonic())
+            
+        return await run_batch(
+            members,
+            lambda member: self.mute_member(member, duration=duration, reason=reason),
+            concurrency
+        )
+        
+    async def check_temp_punishments(self) -> None:
+        now = discord.utils.utcnow().timestamp()
+        due = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            entry = heapq.heappop(self._expiry_heap)
+            if self._expiry_entry_live(entry):
+                due.append(entry)
+                
+        if not due:
+            return
+            
+        semaphore = asyncio.Semaphore(self.expiry_concurrency)
+        
+        async def expire(entry: tuple) -> None:
+            deadline, kind, guild_id, user_id = entry
+            store = self._temp_mutes if kind == 'mute' else self._temp_bans
+            async with semaphore:
+                data = store.get((guild_id, user_id))
+                if data is None or not self._expiry_entry_live(entry):
+                    return
+                done = await self._expire_punishment(kind, guild_id, user_id, data)
+            if store.get((guild_id, user_id)) is not data:
+                return
+            if done:
+                self._clear_temp_punishment(kind, guild_id, user_id)
+            else:
+                self._retry_expiry(kind, guild_id, user_id)
+                
+        await asyncio.gather(*(expire(entry) for entry in due))
+        
+    async def _expire_punishment(self, kind: str, guild_id: int, user_id: int, data: Dict) -> bool:
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return False
+            
+        try:
+            if kind == 'mute':
+                member = guild.get_member(user_id)
+                if member is None:
+                    return False
+                role_id = data.get('role_id') or self._muted_roles.get(guild_id)
+                if role_id is not None and member.get_role(role_id) is not None:
+                    await member.remove_roles(discord.Object(id=role_id), reason="Temporary mute expired")
+            else:
+                await guild.unban(discord.Object(id=user_id), reason="Temporary ban expired")
+            return True
+        except discord.NotFound:
+            return True
+        except Exception as error:
+            metrics.record_error(error)
+            return False
+            
     async def lockdown_channel(self, channel: discord.TextChannel, reason: str = None) -> bool:
         try:
             await channel.set_permissions(channel.guild.default_role, send_messages=False, reason=reason)
             self._lockdowns.add(channel.id)
+            self.storage.set('lockdowns', channel.guild.id, channel.id, True)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
     async def unlock_channel(self, channel: discord.TextChannel, reason: str = None) -> bool:
         try:
             await channel.set_permissions(channel.guild.default_role, send_messages=None, reason=reason)
             self._lockdowns.discard(channel.id)
+            self.storage.delete('lockdowns', channel.guild.id, channel.id)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
     def is_channel_locked(self, channel_id: int) -> bool:
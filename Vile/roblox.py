@@ -1,134 +1,237 @@
 import aiohttp
 from bs4 import BeautifulSoup
 import json
-from typing import Optional, Dict, List, Union
+from typing import Optional, Dict, List, Union, AsyncIterator, Awaitable, Callable, Iterable, Any
 import asyncio
 import re
+from .cache import TTLCache, copy_json
+from .http_client import HTTPClient
+from .instrumentation import instrument_class, metrics
 
+try:
+    import lxml
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+@instrument_class
 class RobloxAPI:
-    def __init__(self):
-        self._session = None
+    CACHE_TTLS = {
+        'username': 300,
+        'profile': 30,
+        'badges': 300,
+        'friends': 120,
+        'groups': 300,
+        'search': 30
+    }
+    
+    def __init__(self, http: Optional[HTTPClient] = None, cache_size: int = 2048, stale_ttl: float = 60):
+        self.http = http or HTTPClient.shared()
         self.base_url = "https://www.roblox.com"
         self.api_url = "https://api.roblox.com"
+        self.cache = TTLCache(cache_size, copy=copy_json)
+        self.cache_ttls = dict(self.CACHE_TTLS)
+        self.stale_ttl = stale_ttl
         
     @property
     def session(self):
-        if self._session is None:
-            self._session = aiohttp.ClientSession()
-        return self._session
+        return self.http.session
         
     async def close(self):
-        if self._session:
-            await self._session.close()
+        await self.http.close()
 
-    async def get_user_by_username(self, username: str) -> Optional[Dict]:
+    async def _cached(self, endpoint: str, key, fetch) -> Optional[Union[Dict, List, str]]:
+        return await self.cache.get_or_fetch(
+            (endpoint, key),
+            fetch,
+            self.cache_ttls[endpoint],
+            self.stale_ttl
+        )
+        
+    async def _get_json(self, url: str) -> Optional[Union[Dict, List]]:
         try:
-            async with self.session.get(f"{self.api_url}/users/get-by-username?username={username}") as response:
+            async with self.http.get(url) as response:
                 if response.status == 200:
-                    data = await response.json()
-                    return data
+                    return await response.json()
                 return None
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
+            
+    async def _fetch_json(self, url: str) -> Union[Dict, List]:
+        async with self.http.get(url) as response:
+            response.raise_for_status()
+            return await response.json()
+            
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
 
-    async def get_user_profile(self, user_id: int) -> Optional[Dict]:
+    async def _paginate(self, url: str, page_size: int, prefetch: int) -> AsyncIterator[Dict]:
+        queue = asyncio.Queue(maxsize=max(prefetch, 1))
+        producer = asyncio.ensure_future(self._produce_pages(url, page_size, queue))
         try:
-            async with self.session.get(f"{self.base_url}/users/{user_id}/profile") as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    profile_data = {
-                        'id': user_id,
-                        'username': None,
-                        'display_name': None,
-                        'description': None,
-                        'created': None,
-                        'badges': [],
-                        'friends': 0,
-                        'followers': 0,
-                        'following': 0,
-                        'place_visits': 0
-                    }
-                    
-                    header = soup.find('div', {'class': 'profile-header'})
-                    if header:
-                        profile_data['username'] = header.find('h2').text.strip() if header.find('h2') else None
-                        profile_data['display_name'] = header.find('div', {'class': 'profile-display-name'}).text.strip() if header.find('div', {'class': 'profile-display-name'}) else None
-                    
-                    about = soup.find('span', {'class': 'profile-about-content-text'})
-                    if about:
-                        profile_data['description'] = about.text.strip()
+            while True:
+                page = await queue.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                for item in page:
+                    yield item
+        finally:
+            producer.cancel()
+
+    async def _produce_pages(self, url: str, page_size: int, queue: asyncio.Queue) -> None:
+        page = 1
+        cursor = None
+        try:
+            while True:
+                page_url = f"{url}?limit={page_size}&pageSize={page_size}&page={page}"
+                if cursor:
+                    page_url += f"&cursor={cursor}"
                     
-                    stats = soup.find_all('div', {'class': 'profile-stat'})
-                    for stat in stats:
-                        label = stat.find('p', {'class': 'text-label'}).text.strip().lower() if stat.find('p', {'class': 'text-label'}) else ''
-                        value = stat.find('p', {'class': 'text-lead'}).text.strip() if stat.find('p', {'class': 'text-lead'}) else '0'
-                        value = int(''.join(filter(str.isdigit, value)) or 0)
-                        
-                        if 'friends' in label:
-                            profile_data['friends'] = value
-                        elif 'followers' in label:
-                            profile_data['followers'] = value
-                        elif 'following' in label:
-                            profile_data['following'] = value
-                        elif 'place visits' in label:
-                            profile_data['place_visits'] = value
+                data = await self._fetch_json(page_url)
+                if isinstance(data, list):
+                    await queue.put(data)
+                    break
+                if not data or not data.get('data'):
+                    break
                     
-                    return profile_data
-                return None
-        except:
+                await queue.put(data['data'])
+                if 'nextPageCursor' in data:
+                    cursor = data['nextPageCursor']
+                    if not cursor:
+                        break
+                elif len(data['data']) < page_size:
+                    break
+                page += 1
+        except Exception as error:
+            await queue.put(error)
+            return
+        await queue.put(None)
+
+    async def get_user_by_username(self, username: str) -> Optional[Dict]:
+        return await self._cached(
+            'username',
+            username.lower(),
+            lambda: self._get_json(f"{self.api_url}/users/get-by-username?username={username}")
+        )
+
+    async def get_profile_snapshot(self, user_id: int) -> Optional[Dict]:
+        return await self._cached('profile', user_id, lambda: self._fetch_profile_snapshot(user_id))
+
+    async def _fetch_profile_snapshot(self, user_id: int) -> Optional[Dict]:
+        try:
+            async with self.http.get(f"{self.base_url}/users/{user_id}/profile") as response:
+                if response.status != 200:
+                    return None
+                html = await response.text()
+                
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.parse_profile, html, user_id)
+        except Exception as error:
+            metrics.record_error(error)
             return None
 
+    @staticmethod
+    def parse_profile(html: str, user_id: int) -> Dict:
+        soup = BeautifulSoup(html, HTML_PARSER)
+        
+        profile_data = {
+            'id': user_id,
+            'username': None,
+            'display_name': None,
+            'description': None,
+            'created': None,
+            'badges': [],
+            'friends': 0,
+            'followers': 0,
+            'following': 0,
+            'place_visits': 0
+        }
+        
+        header = soup.find('div', {'class': 'profile-header'})
+        if header:
+            profile_data['username'] = header.find('h2').text.strip() if header.find('h2') else None
+            profile_data['display_name'] = header.find('div', {'class': 'profile-display-name'}).text.strip() if header.find('div', {'class': 'profile-display-name'}) else None
+        
+        about = soup.find('span', {'class': 'profile-about-content-text'})
+        if about:
+            profile_data['description'] = about.text.strip()
+        
+        stats = soup.find_all('div', {'class': 'profile-stat'})
+        for stat in stats:
+            label = stat.find('p', {'class': 'text-label'}).text.strip().lower() if stat.find('p', {'class': 'text-label'}) else ''
+            value = stat.find('p', {'class': 'text-lead'}).text.strip() if stat.find('p', {'class': 'text-lead'}) else '0'
+            value = int(''.join(filter(str.isdigit, value)) or 0)
+            
+            if 'friends' in label:
+                profile_data['friends'] = value
+            elif 'followers' in label:
+                profile_data['followers'] = value
+            elif 'following' in label:
+                profile_data['following'] = value
+            elif 'place visits' in label:
+                profile_data['place_visits'] = value
+        
+        status = soup.find('div', {'class': 'profile-status'})
+        profile_data['last_online'] = status.text.strip() if status else None
+        
+        return profile_data
+
+    async def get_user_profile(self, user_id: int) -> Optional[Dict]:
+        return await self.get_profile_snapshot(user_id)
+
     async def get_user_badges(self, user_id: int) -> List[Dict]:
-        try:
-            async with self.session.get(f"{self.api_url}/users/{user_id}/badges") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('data', [])
-                return []
-        except:
-            return []
+        data = await self._cached(
+            'badges',
+            user_id,
+            lambda: self._get_json(f"{self.api_url}/users/{user_id}/badges")
+        )
+        return data.get('data', []) if data else []
 
     async def get_user_friends(self, user_id: int, page_size: int = 100) -> List[Dict]:
-        try:
-            async with self.session.get(f"{self.api_url}/users/{user_id}/friends?page=1&pageSize={page_size}") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('data', [])
-                return []
-        except:
-            return []
+        data = await self._cached(
+            'friends',
+            (user_id, page_size),
+            lambda: self._get_json(f"{self.api_url}/users/{user_id}/friends?page=1&pageSize={page_size}")
+        )
+        return data.get('data', []) if data else []
 
     async def get_user_groups(self, user_id: int) -> List[Dict]:
-        try:
-            async with self.session.get(f"{self.api_url}/users/{user_id}/groups") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                return []
-        except:
-            return []
+        data = await self._cached(
+            'groups',
+            user_id,
+            lambda: self._get_json(f"{self.api_url}/users/{user_id}/groups")
+        )
+        return data if data else []
+
+    def iter_user_friends(self, user_id: int, page_size: int = 100, prefetch: int = 1) -> AsyncIterator[Dict]:
+        return self._paginate(f"{self.api_url}/users/{user_id}/friends", page_size, prefetch)
+
+    def iter_user_badges(self, user_id: int, page_size: int = 100, prefetch: int = 1) -> AsyncIterator[Dict]:
+        return self._paginate(f"{self.api_url}/users/{user_id}/badges", page_size, prefetch)
+
+    def iter_user_groups(self, user_id: int, page_size: int = 100, prefetch: int = 1) -> AsyncIterator[Dict]:
+        return self._paginate(f"{self.api_url}/users/{user_id}/groups", page_size, prefetch)
+
+    async def fetch_many(self, fetch: Callable[[int], Awaitable[Any]], user_ids: Iterable[int], concurrency: int = 10) -> Dict[int, Any]:
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(user_id: int):
+            async with semaphore:
+                return user_id, await fetch(user_id)
+                
+        return dict(await asyncio.gather(*(run(user_id) for user_id in set(user_ids))))
 
     async def get_last_online(self, user_id: int) -> Optional[str]:
-        try:
-            async with self.session.get(f"{self.base_url}/users/{user_id}/profile") as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    last_online = soup.find('div', {'class': 'profile-status'})
-                    if last_online:
-                        return last_online.text.strip()
-                return None
-        except:
-            return None
+        snapshot = await self.get_profile_snapshot(user_id)
+        return snapshot['last_online'] if snapshot else None
 
     async def search_users(self, keyword: str, limit: int = 10) -> List[Dict]:
-        try:
-            async with self.session.get(f"{self.api_url}/users/search?keyword={keyword}&limit={limit}") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('data', [])
-                return []
-        except:
-            return []
+        data = await self._cached(
+            'search',
+            (keyword.lower(), limit),
+            lambda: self._get_json(f"{self.api_url}/users/search?keyword={keyword}&limit={limit}")
+        )
+        return data.get('data', []) if data else []
@@ -4,60 +4,158 @@ from typing import List, Optional, Union, Dict
 import asyncio
 import json
 import re
+import time
+from collections import deque
+from .left_roles import LeftRoleStore
+from .role_batcher import RoleEditBatcher
+from .storage import Storage
+from .instrumentation import instrument_class, metrics
 
+_CUSTOM_EMOJI = re.compile(r'^<?a?:?(?:[A-Za-z0-9_~]+:)?(\d{15,25})>?$')
+
+def emoji_key(emoji: Union[str, int, discord.PartialEmoji, discord.Emoji]) -> Union[int, str]:
+    emoji_id = getattr(emoji, 'id', None)
+    if emoji_id:
+        return emoji_id
+    if isinstance(emoji, int):
+        return emoji
+        
+    text = str(emoji).strip()
+    match = _CUSTOM_EMOJI.match(text)
+    if match:
+        return int(match.group(1))
+    return text.replace('\ufe0f', '')
+
+@instrument_class
 class RoleAPI:
-    def __init__(self, bot):
+    def __init__(self, bot, storage: Optional[Storage] = None, reaction_window: float = 0.5):
         self.bot = bot
+        self.storage = storage or Storage()
+        self.reaction_edits = RoleEditBatcher.shared(bot)
+        self.reaction_window = reaction_window
         self._reaction_roles = {}
+        self._reaction_guilds = {}
         self._autoroles = {}
         self._booster_roles = {}
-        self._left_roles = {}
+        self._left_roles = LeftRoleStore(self.storage)
+        self.join_wave_threshold = 10
+        self.join_wave_window = 10
+        self.join_wave_rate = 2
+        self._recent_joins = {}
+        self._join_queues = {}
+        self._join_workers = {}
+        self.join_requests = 0
         
-    async def setup_reaction_role(self, message_id: str, emoji: str, role_id: int) -> None:
+    async def load_state(self) -> None:
+        self._reaction_roles = {}
+        self._reaction_guilds = {}
+        for guild_id, messages in (await self.storage.load('reaction_roles')).items():
+            for message_id, entries in messages.items():
+                message_id = int(message_id)
+                self._reaction_roles[message_id] = {
+                    (int(key) if key.isdigit() else key): tuple(entry) if isinstance(entry, list) else (entry, None)
+                    for key, entry in entries.items()
+                }
+                if guild_id:
+                    self._reaction_guilds[message_id] = int(guild_id)
+        self._autoroles = {
+            guild_id: set(data['roles'])
+            for guild_id, data in (await self.storage.load('autoroles')).items()
+        }
+        self._booster_roles = {
+            guild_id: data['settings']
+            for guild_id, data in (await self.storage.load('booster_roles')).items()
+        }
+        await self._left_roles.load()
+        
+    def _persist_reaction_roles(self, message_id: int) -> None:
+        entries = self._reaction_roles.get(message_id)
+        guild_id = self._reaction_guilds.get(message_id, '')
+        if entries:
+            self.storage.set('reaction_roles', guild_id, message_id, {str(key): list(entry) for key, entry in entries.items()})
+        else:
+            self._reaction_roles.pop(message_id, None)
+            self._reaction_guilds.pop(message_id, None)
+            self.storage.delete('reaction_roles', guild_id, message_id)
+            
+    def _claim_reaction_message(self, message_id: int, guild_id: int) -> None:
+        previous = self._reaction_guilds.get(message_id, '')
+        if previous != guild_id:
+            self.storage.delete('reaction_roles', previous, message_id)
+            self._reaction_guilds[message_id] = guild_id
+        self._persist_reaction_roles(message_id)
+        
+    async def setup_reaction_role(self, message_id: Union[str, int], emoji: Union[str, discord.PartialEmoji], role_id: int, group: Optional[str] = None, guild_id: Optional[int] = None) -> None:
+        message_id = int(message_id)
         if message_id not in self._reaction_roles:
             self._reaction_roles[message_id] = {}
-        self._reaction_roles[message_id][emoji] = role_id
+        self._reaction_roles[message_id][emoji_key(emoji)] = (role_id, group)
+        if guild_id is not None:
+            self._claim_reaction_message(message_id, int(guild_id))
+        else:
+            self._persist_reaction_roles(message_id)
         
-    def remove_reaction_role(self, message_id: str, emoji: str) -> bool:
+    def remove_reaction_role(self, message_id: Union[str, int], emoji: Union[str, discord.PartialEmoji]) -> bool:
+        message_id = int(message_id)
         if message_id in self._reaction_roles:
-            return self._reaction_roles[message_id].pop(emoji, None) is not None
+            if self._reaction_roles[message_id].pop(emoji_key(emoji), None) is not None:
+                self._persist_reaction_roles(message_id)
+                return True
         return False
         
-    def get_reaction_role(self, message_id: str, emoji: str) -> Optional[int]:
-        return self._reaction_roles.get(message_id, {}).get(emoji)
+    def get_reaction_role(self, message_id: Union[str, int], emoji: Union[str, discord.PartialEmoji]) -> Optional[int]:
+        entry = self._reaction_roles.get(int(message_id), {}).get(emoji_key(emoji))
+        return entry[0] if entry else None
         
-    def get_all_reaction_roles(self, message_id: str) -> Dict[str, int]:
-        return self._reaction_roles.get(message_id, {})
+    def get_all_reaction_roles(self, message_id: Union[str, int]) -> Dict[str, int]:
+        return {
+            str(key): role_id
+            for key, (role_id, group) in self._reaction_roles.get(int(message_id), {}).items()
+        }
         
-    async def handle_reaction_add(self, member: discord.Member, message_id: str, emoji: str) -> None:
-        role_id = self.get_reaction_role(message_id, emoji)
-        if role_id:
-            role = member.guild.get_role(role_id)
-            if role:
-                try:
-                    await member.add_roles(role)
-                except:
-                    pass
-                    
-    async def handle_reaction_remove(self, member: discord.Member, message_id: str, emoji: str) -> None:
+    async def handle_reaction_add(self, member: discord.Member, message_id: Union[str, int], emoji: Union[str, discord.PartialEmoji]) -> None:
+        message_id = int(message_id)
+        entries = self._reaction_roles.get(message_id)
+        if not entries:
+            return
+        entry = entries.get(emoji_key(emoji))
+        if not entry:
+            return
+        if message_id not in self._reaction_guilds:
+            self._claim_reaction_message(message_id, member.guild.id)
+            
+        role_id, group = entry
+        role = member.guild.get_role(role_id)
+        if not role:
+            return
+            
+        if group is not None:
+            exclusive = [
+                member.guild.get_role(other_id)
+                for other_id, other_group in entries.values()
+                if other_group == group and other_id != role_id
+            ]
+            self.reaction_edits.remove(member, *filter(None, exclusive), window=self.reaction_window, reason="Reaction role")
+        self.reaction_edits.add(member, role, window=self.reaction_window, reason="Reaction role")
+        
+    async def handle_reaction_remove(self, member: discord.Member, message_id: Union[str, int], emoji: Union[str, discord.PartialEmoji]) -> None:
         role_id = self.get_reaction_role(message_id, emoji)
         if role_id:
             role = member.guild.get_role(role_id)
             if role:
-                try:
-                    await member.remove_roles(role)
-                except:
-                    pass
-                    
+                self.reaction_edits.remove(member, role, window=self.reaction_window, reason="Reaction role")
+                
     async def setup_autorole(self, guild_id: str, role_id: int) -> None:
         if guild_id not in self._autoroles:
             self._autoroles[guild_id] = set()
         self._autoroles[guild_id].add(role_id)
+        self.storage.set('autoroles', guild_id, 'roles', list(self._autoroles[guild_id]))
         
     def remove_autorole(self, guild_id: str, role_id: int) -> bool:
         if guild_id in self._autoroles:
             try:
                 self._autoroles[guild_id].remove(role_id)
+                self.storage.set('autoroles', guild_id, 'roles', list(self._autoroles[guild_id]))
                 return True
             except KeyError:
                 pass
@@ -66,42 +164,74 @@ class RoleAPI:
     def get_autoroles(self, guild_id: str) -> List[int]:
         return list(self._autoroles.get(guild_id, set()))
         
-    async def handle_member_join(self, member: discord.Member) -> None:
+    async def _restore_roles(self, member: discord.Member) -> List[discord.Role]:
         guild_id = str(member.guild.id)
+        role_ids = set(self.get_autoroles(guild_id))
+        role_ids.update(await self._left_roles.pop(guild_id, member.id))
         
-
-        for role_id in self.get_autoroles(guild_id):
+        current = {role.id for role in member.roles}
+        roles = []
+        for role_id in role_ids - current:
             role = member.guild.get_role(role_id)
-            if role:
-                try:
-                    await member.add_roles(role)
-                except:
-                    pass
-                    
-
-        if guild_id in self._left_roles and str(member.id) in self._left_roles[guild_id]:
-            for role_id in self._left_roles[guild_id][str(member.id)]:
-                role = member.guild.get_role(role_id)
-                if role:
-                    try:
-                        await member.add_roles(role)
-                    except:
-                        pass
-            del self._left_roles[guild_id][str(member.id)]
+            if role and not role.is_default() and role.is_assignable():
+                roles.append(role)
+        return roles
+        
+    async def _apply_join_roles(self, member: discord.Member, roles: List[discord.Role]) -> None:
+        self.join_requests += 1
+        try:
+            await member.add_roles(*roles, reason="Autoroles and restored roles", atomic=False)
+        except Exception as error:
+            metrics.record_error(error)
             
-    async def handle_member_remove(self, member: discord.Member) -> None:
-        guild_id = str(member.guild.id)
+    def _in_join_wave(self, guild_id: int) -> bool:
+        now = time.monotonic()
+        joins = self._recent_joins.get(guild_id)
+        if joins is None or joins.maxlen != self.join_wave_threshold:
+            joins = self._recent_joins[guild_id] = deque(maxlen=self.join_wave_threshold)
+        joins.append(now)
+        return len(joins) == joins.maxlen and now - joins[0] <= self.join_wave_window
+        
+    async def _drain_join_queue(self, guild_id: int) -> None:
+        queue = self._join_queues[guild_id]
+        try:
+            while queue:
+                member, roles = queue.popleft()
+                await self._apply_join_roles(member, roles)
+                await asyncio.sleep(1 / self.join_wave_rate)
+        finally:
+            if self._join_queues.get(guild_id) is queue:
+                del self._join_queues[guild_id]
+            if self._join_workers.get(guild_id) is asyncio.current_task():
+                del self._join_workers[guild_id]
         
-        if guild_id not in self._left_roles:
-            self._left_roles[guild_id] = {}
+    async def handle_member_join(self, member: discord.Member) -> None:
+        roles = await self._restore_roles(member)
+        guild_id = member.guild.id
+        in_wave = self._in_join_wave(guild_id)
+        if not roles:
+            return
             
-        self._left_roles[guild_id][str(member.id)] = [
+        if guild_id in self._join_queues or in_wave:
+            self._join_queues.setdefault(guild_id, deque()).append((member, roles))
+            if guild_id not in self._join_workers:
+                self._join_workers[guild_id] = asyncio.create_task(self._drain_join_queue(guild_id))
+            return
+            
+        await self._apply_join_roles(member, roles)
+        
+    async def handle_member_remove(self, member: discord.Member) -> None:
+        self._left_roles.put(member.guild.id, member.id, [
             role.id for role in member.roles 
             if role.id != member.guild.id  
-        ]
+        ])
+        
+    def get_left_roles_memory(self) -> Dict[str, int]:
+        return self._left_roles.memory_usage()
         
     async def setup_booster_role(self, guild_id: str, settings: Dict) -> None:
         self._booster_roles[guild_id] = settings
+        self.storage.set('booster_roles', guild_id, 'settings', settings)
         
     def get_booster_settings(self, guild_id: str) -> Dict:
         return self._booster_roles.get(guild_id, {})
@@ -119,8 +249,8 @@ class RoleAPI:
             if role:
                 try:
                     await member.add_roles(role)
-                except:
-                    pass
+                except Exception as error:
+                    metrics.record_error(error)
                     
     async def handle_member_unboost(self, member: discord.Member) -> None:
         guild_id = str(member.guild.id)
@@ -135,5 +265,5 @@ class RoleAPI:
             if role:
                 try:
                     await member.remove_roles(role)
-                except:
-                    pass
+                except Exception as error:
+                    metrics.record_error(error)
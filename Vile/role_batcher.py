@@ -0,0 +1,130 @@
+import discord
+import asyncio
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+from .instrumentation import metrics
+
+class _PendingRoleEdit:
+    __slots__ = ('member', 'add', 'remove', 'task', 'first', 'last', 'window', 'reasons')
+
+    def __init__(self, member: discord.Member, window: float):
+        self.member = member
+        self.add = {}
+        self.remove = set()
+        self.task = None
+        self.first = self.last = time.monotonic()
+        self.window = window
+        self.reasons = set()
+
+class RoleEditBatcher:
+    _shared = weakref.WeakKeyDictionary()
+
+    def __init__(self, window: float = 0.5, reason: Optional[str] = None, max_delay: Optional[float] = None):
+        self.window = window
+        self.max_delay = max_delay if max_delay is not None else window * 4
+        self.reason = reason
+        self._pending = {}
+        self.queued = 0
+        self.edits = 0
+        self.failed = 0
+
+    @classmethod
+    def shared(cls, bot) -> 'RoleEditBatcher':
+        batcher = cls._shared.get(bot)
+        if batcher is None:
+            batcher = cls._shared[bot] = cls(reason="Role sync")
+        return batcher
+
+    def add(self, member: discord.Member, *roles: discord.Role, window: Optional[float] = None, reason: Optional[str] = None) -> None:
+        pending = self._get_pending(member, window, reason)
+        for role in roles:
+            pending.remove.discard(role.id)
+            pending.add[role.id] = role
+
+    def remove(self, member: discord.Member, *roles: discord.Role, window: Optional[float] = None, reason: Optional[str] = None) -> None:
+        pending = self._get_pending(member, window, reason)
+        for role in roles:
+            pending.add.pop(role.id, None)
+            pending.remove.add(role.id)
+
+    def _get_pending(self, member: discord.Member, window: Optional[float], reason: Optional[str]) -> _PendingRoleEdit:
+        self.queued += 1
+        window = self.window if window is None else window
+        key = (member.guild.id, member.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingRoleEdit(member, window)
+            pending.task = asyncio.ensure_future(self._flush_later(key))
+        else:
+            pending.member = member
+            pending.last = time.monotonic()
+            if window < pending.window:
+                pending.window = window
+                pending.task.cancel()
+                pending.task = asyncio.ensure_future(self._flush_later(key))
+        if reason:
+            pending.reasons.add(reason)
+        return pending
+
+    async def _flush_later(self, key: Tuple[int, int]) -> None:
+        pending = self._pending[key]
+        while True:
+            delay = min(pending.last + pending.window, pending.first + self.max_delay) - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            await self._apply(pending)
+
+    async def flush(self) -> None:
+        pending_edits = list(self._pending.values())
+        self._pending.clear()
+        for pending in pending_edits:
+            pending.task.cancel()
+        await asyncio.gather(*(self._apply(pending) for pending in pending_edits))
+
+    async def _apply(self, pending: _PendingRoleEdit) -> bool:
+        guild = pending.member.guild
+        member = guild.get_member(pending.member.id) or pending.member
+        reason = ', '.join(sorted(pending.reasons)) or self.reason
+        current = {role.id for role in member.roles}
+
+        added = [
+            role for role_id, role in pending.add.items()
+            if role_id not in current and role.is_assignable()
+        ]
+        removed = [
+            role for role in member.roles
+            if role.id in pending.remove and role.is_assignable()
+        ]
+        if not added and not removed:
+            return True
+
+        self.edits += 1
+        try:
+            if not removed and len(added) == 1:
+                await member.add_roles(*added, reason=reason)
+            elif not added and len(removed) == 1:
+                await member.remove_roles(*removed, reason=reason)
+            else:
+                removed_ids = {role.id for role in removed}
+                roles = [
+                    role for role in member.roles
+                    if not role.is_default() and role.id not in removed_ids and guild.get_role(role.id) is not None
+                ]
+                await member.edit(roles=roles + added, reason=reason)
+            return True
+        except Exception as error:
+            self.failed += 1
+            metrics.record_error(error)
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self.queued,
+            'edits': self.edits,
+            'failed': self.failed,
+            'pending': len(self._pending)
+        }
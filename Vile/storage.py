@@ -0,0 +1,217 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .instrumentation import metrics
+
+_DELETED = object()
+
+class Storage:
+    def set(self, namespace: str, guild_id: Any, key: Any, value: Any) -> None:
+        pass
+
+    def delete(self, namespace: str, guild_id: Any, key: Any) -> None:
+        pass
+
+    async def get(self, namespace: str, guild_id: Any, key: Any) -> Optional[Any]:
+        return None
+
+    async def load(self, namespace: str) -> Dict[str, Dict[str, Any]]:
+        return {}
+
+    async def expire(self, namespace: str, field: str, cutoff: float) -> int:
+        return 0
+
+    async def load_guild(self, guild_id: Any) -> Dict[str, Dict[str, Any]]:
+        return {}
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class SQLiteStorage(Storage):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS state ("
+        "guild_id TEXT NOT NULL, "
+        "namespace TEXT NOT NULL, "
+        "key TEXT NOT NULL, "
+        "value TEXT NOT NULL, "
+        "PRIMARY KEY (guild_id, namespace, key)"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS state_namespace ON state (namespace, guild_id)"
+    )
+
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 1000, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vile-sqlite')
+        self._connection = None
+        self._pending = {}
+        self._writing = {}
+        self._flush_task = None
+        self._flush_lock = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def set(self, namespace: str, guild_id: Any, key: Any, value: Any) -> None:
+        self._pending[(str(guild_id), namespace, str(key))] = value
+        self._schedule_flush()
+
+    def delete(self, namespace: str, guild_id: Any, key: Any) -> None:
+        self._pending[(str(guild_id), namespace, str(key))] = _DELETED
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = 0 if len(self._pending) >= self.batch_size else self.flush_interval
+        self._flush_task = loop.create_task(self._delayed_flush(delay))
+
+    async def _delayed_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+        except Exception as error:
+            metrics.record_error(error)
+            await asyncio.sleep(self.flush_interval)
+        if self._pending:
+            self._flush_task = None
+            self._schedule_flush()
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            upserts = []
+            deletes = []
+            invalid = []
+            for (guild_id, namespace, key), value in batch.items():
+                if value is _DELETED:
+                    deletes.append((guild_id, namespace, key))
+                    continue
+                try:
+                    upserts.append((guild_id, namespace, key, json.dumps(value)))
+                except (TypeError, ValueError) as error:
+                    metrics.record_error(error)
+                    invalid.append((guild_id, namespace, key))
+            for pending_key in invalid:
+                del batch[pending_key]
+
+            self._writing = batch
+            try:
+                await self._run(self._write_batch, upserts, deletes)
+            except Exception:
+                for pending_key, value in batch.items():
+                    self._pending.setdefault(pending_key, value)
+                raise
+            finally:
+                self._writing = {}
+
+    def _write_batch(self, upserts: List[Tuple], deletes: List[Tuple]) -> None:
+        connection = self._connect()
+        with connection:
+            if upserts:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO state (guild_id, namespace, key, value) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+            if deletes:
+                connection.executemany(
+                    "DELETE FROM state WHERE guild_id = ? AND namespace = ? AND key = ?",
+                    deletes
+                )
+
+    def _read(self, query: str, params: Tuple) -> List[Tuple]:
+        return self._connect().execute(query, params).fetchall()
+
+    async def get(self, namespace: str, guild_id: Any, key: Any) -> Optional[Any]:
+        pending_key = (str(guild_id), namespace, str(key))
+        pending = self._pending.get(pending_key, self._writing.get(pending_key))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            return pending
+
+        rows = await self._run(
+            self._read,
+            "SELECT value FROM state WHERE guild_id = ? AND namespace = ? AND key = ?",
+            (str(guild_id), namespace, str(key))
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def load(self, namespace: str) -> Dict[str, Dict[str, Any]]:
+        await self.flush()
+        rows = await self._run(
+            self._read,
+            "SELECT guild_id, key, value FROM state WHERE namespace = ?",
+            (namespace,)
+        )
+
+        data = {}
+        for guild_id, key, value in rows:
+            data.setdefault(guild_id, {})[key] = json.loads(value)
+        return data
+
+    def _expire(self, namespace: str, field: str, cutoff: float) -> int:
+        connection = self._connect()
+        with connection:
+            return connection.execute(
+                "DELETE FROM state WHERE namespace = ? AND json_extract(value, ?) < ?",
+                (namespace, f'$.{field}', cutoff)
+            ).rowcount
+
+    async def expire(self, namespace: str, field: str, cutoff: float) -> int:
+        await self.flush()
+        return await self._run(self._expire, namespace, field, cutoff)
+
+    async def load_guild(self, guild_id: Any) -> Dict[str, Dict[str, Any]]:
+        await self.flush()
+        rows = await self._run(
+            self._read,
+            "SELECT namespace, key, value FROM state WHERE guild_id = ?",
+            (str(guild_id),)
+        )
+
+        data = {}
+        for namespace, key, value in rows:
+            data.setdefault(namespace, {})[key] = json.loads(value)
+        return data
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
@@ -3,22 +3,109 @@ from discord.ext import commands
 from typing import List, Optional, Union, Dict
 import asyncio
 import json
+from collections import deque
+from .batch import run_batch
+from .role_batcher import RoleEditBatcher
+from .storage import Storage
+from .instrumentation import instrument_class, metrics
 
+@instrument_class
 class VoiceAPI:
-    def __init__(self, bot):
+    def __init__(self, bot, storage: Optional[Storage] = None, voice_window: float = 1.0):
         self.bot = bot
+        self.storage = storage or Storage()
+        self.voice_role_edits = RoleEditBatcher.shared(bot)
+        self.voice_window = voice_window
         self._vc_data = {}
-        self._temp_channels = set()
+        self._temp_channels = {}
+        self._temp_counts = {}
+        self._pending_deletes = {}
+        self._pools = {}
+        self._pool_refills = {}
         self._voice_roles = {}
         
+    async def load_state(self) -> None:
+        self._vc_data = {
+            guild_id: {int(channel_id): settings for channel_id, settings in channels.items()}
+            for guild_id, channels in (await self.storage.load('voice_channels')).items()
+        }
+        self._voice_roles = {
+            guild_id: {int(voice_id): role_id for voice_id, role_id in roles.items()}
+            for guild_id, roles in (await self.storage.load('voice_roles')).items()
+        }
+        
+        self._temp_channels = {}
+        self._temp_counts = {}
+        for channels in (await self.storage.load('temp_channels')).values():
+            for channel_id, record in channels.items():
+                self._temp_channels[int(channel_id)] = record
+                if not record['pooled']:
+                    self._temp_counts[record['guild_id']] = self._temp_counts.get(record['guild_id'], 0) + 1
+                    
+    def _track_temp_channel(self, channel: discord.VoiceChannel, hub_id: int, owner_id: Optional[int], pooled: bool = False) -> None:
+        previous = self._temp_channels.get(channel.id)
+        if not pooled and (previous is None or previous['pooled']):
+            self._temp_counts[channel.guild.id] = self._temp_counts.get(channel.guild.id, 0) + 1
+            
+        record = {
+            'guild_id': channel.guild.id,
+            'hub_id': hub_id,
+            'owner_id': owner_id,
+            'pooled': pooled
+        }
+        self._temp_channels[channel.id] = record
+        self.storage.set('temp_channels', channel.guild.id, channel.id, record)
+        
+    def _untrack_temp_channel(self, channel_id: int) -> None:
+        record = self._temp_channels.pop(channel_id, None)
+        if record is None:
+            return
+        if not record['pooled']:
+            self._temp_counts[record['guild_id']] -= 1
+        self.storage.delete('temp_channels', record['guild_id'], channel_id)
+        
+    async def reconcile_temp_channels(self) -> int:
+        removed = 0
+        self._pools = {}
+        
+        for channel_id, record in list(self._temp_channels.items()):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                self._untrack_temp_channel(channel_id)
+                removed += 1
+                continue
+                
+            if record['pooled']:
+                self._pools.setdefault(record['hub_id'], deque()).append(channel_id)
+            elif not channel.members:
+                try:
+                    await channel.delete(reason="Orphaned temporary channel")
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as error:
+                    metrics.record_error(error)
+                    continue
+                self._untrack_temp_channel(channel_id)
+                removed += 1
+                
+        for hubs in self._vc_data.values():
+            for hub_id, settings in hubs.items():
+                hub = self.bot.get_channel(hub_id)
+                if hub is not None:
+                    self._refill_pool(hub, settings)
+        return removed
+        
     async def setup_voice_role(self, guild_id: str, voice_id: int, role_id: int) -> None:
         if guild_id not in self._voice_roles:
             self._voice_roles[guild_id] = {}
         self._voice_roles[guild_id][voice_id] = role_id
+        self.storage.set('voice_roles', guild_id, voice_id, role_id)
         
     def remove_voice_role(self, guild_id: str, voice_id: int) -> bool:
         if guild_id in self._voice_roles:
-            return self._voice_roles[guild_id].pop(voice_id, None) is not None
+            if self._voice_roles[guild_id].pop(voice_id, None) is not None:
+                self.storage.delete('voice_roles', guild_id, voice_id)
+                return True
         return False
         
     def get_voice_role(self, guild_id: str, voice_id: int) -> Optional[int]:
@@ -27,15 +114,16 @@ class VoiceAPI:
     async def handle_voice_join(self, member: discord.Member, channel: discord.VoiceChannel) -> None:
         guild_id = str(member.guild.id)
         
+        pending_delete = self._pending_deletes.pop(channel.id, None)
+        if pending_delete is not None:
+            pending_delete.cancel()
+        
         role_id = self.get_voice_role(guild_id, channel.id)
         if role_id:
             role = member.guild.get_role(role_id)
             if role:
-                try:
-                    await member.add_roles(role)
-                except:
-                    pass
-                    
+                self.voice_role_edits.add(member, role, window=self.voice_window, reason="Voice role")
+                
         if channel.id in self._vc_data.get(guild_id, {}):
             settings = self._vc_data[guild_id][channel.id]
             if settings.get('auto_create', False):
@@ -48,54 +136,119 @@ class VoiceAPI:
         if role_id:
             role = member.guild.get_role(role_id)
             if role:
-                try:
-                    await member.remove_roles(role)
-                except:
-                    pass
-                    
-        if channel.id in self._temp_channels and not channel.members:
-            try:
-                await channel.delete()
-                self._temp_channels.remove(channel.id)
-            except:
-                pass
+                self.voice_role_edits.remove(member, role, window=self.voice_window, reason="Voice role")
                 
+        record = self._temp_channels.get(channel.id)
+        if record and not record['pooled'] and not channel.members:
+            settings = self.get_voice_settings(guild_id, record['hub_id'])
+            self._schedule_temp_delete(channel, settings.get('grace_period', 10))
+            
+    def _schedule_temp_delete(self, channel: discord.VoiceChannel, grace_period: float) -> None:
+        if channel.id not in self._pending_deletes:
+            self._pending_deletes[channel.id] = asyncio.create_task(self._delete_temp_channel(channel, grace_period))
+            
+    async def _delete_temp_channel(self, channel: discord.VoiceChannel, grace_period: float) -> None:
+        try:
+            await asyncio.sleep(grace_period)
+            if channel.members:
+                return
+            await channel.delete(reason="Temporary channel empty")
+            self._untrack_temp_channel(channel.id)
+        except discord.NotFound:
+            self._untrack_temp_channel(channel.id)
+        except discord.HTTPException as error:
+            metrics.record_error(error)
+        finally:
+            if self._pending_deletes.get(channel.id) is asyncio.current_task():
+                del self._pending_deletes[channel.id]
+                
+    def _take_pooled_channel(self, hub_id: int, guild: discord.Guild) -> Optional[discord.VoiceChannel]:
+        pool = self._pools.get(hub_id)
+        while pool:
+            channel = guild.get_channel(pool.popleft())
+            if channel is not None:
+                return channel
+        return None
+        
+    def _refill_pool(self, hub: discord.VoiceChannel, settings: Dict) -> None:
+        pool_size = settings.get('pool_size', 0)
+        if not pool_size or hub.id in self._pool_refills:
+            return
+        if len(self._pools.get(hub.id, ())) >= pool_size:
+            return
+        self._pool_refills[hub.id] = asyncio.create_task(self._fill_pool(hub, settings, pool_size))
+        
+    async def _fill_pool(self, hub: discord.VoiceChannel, settings: Dict, pool_size: int) -> None:
+        pool = self._pools.setdefault(hub.id, deque())
+        try:
+            while len(pool) < pool_size:
+                overwrites = dict(hub.category.overwrites) if hub.category else {}
+                overwrites[hub.guild.default_role] = discord.PermissionOverwrite(view_channel=False, connect=False)
+                
+                channel = await hub.guild.create_voice_channel(
+                    name=settings.get('pool_name', 'Voice'),
+                    category=hub.category,
+                    bitrate=settings.get('bitrate', 64000),
+                    user_limit=settings.get('user_limit', 0),
+                    overwrites=overwrites,
+                    reason="Pre-creating temporary channel"
+                )
+                pool.append(channel.id)
+                self._track_temp_channel(channel, hub.id, None, pooled=True)
+        except discord.HTTPException as error:
+            metrics.record_error(error)
+        finally:
+            del self._pool_refills[hub.id]
+            
     async def create_temp_channel(self, member: discord.Member, settings: Dict) -> Optional[discord.VoiceChannel]:
         try:
+            hub = member.voice.channel
+            guild = member.guild
             channel_name = settings.get('name_format', '🔊 {user}').format(
                 user=member.display_name,
-                count=len(member.guild.voice_channels) + 1
-            )
-            
-            channel = await member.guild.create_voice_channel(
-                name=channel_name,
-                category=member.voice.channel.category,
-                bitrate=settings.get('bitrate', 64000),
-                user_limit=settings.get('user_limit', 0)
+                count=self._temp_counts.get(guild.id, 0) + 1
             )
             
-            await channel.set_permissions(member, 
+            overwrites = dict(hub.category.overwrites) if hub.category else {}
+            overwrites[member] = discord.PermissionOverwrite(
                 manage_channels=True,
                 manage_permissions=True,
                 connect=True,
                 speak=True
             )
             
-            await member.move_to(channel)
+            channel = self._take_pooled_channel(hub.id, guild)
+            if channel is not None:
+                await channel.edit(name=channel_name, overwrites=overwrites)
+            else:
+                channel = await guild.create_voice_channel(
+                    name=channel_name,
+                    category=hub.category,
+                    bitrate=settings.get('bitrate', 64000),
+                    user_limit=settings.get('user_limit', 0),
+                    overwrites=overwrites
+                )
+            self._track_temp_channel(channel, hub.id, member.id)
+            self._schedule_temp_delete(channel, settings.get('grace_period', 10))
             
-            self._temp_channels.add(channel.id)
+            await member.move_to(channel)
+            self._refill_pool(hub, settings)
             return channel
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return None
             
     async def setup_voice_channel(self, guild_id: str, channel_id: int, settings: Dict) -> None:
         if guild_id not in self._vc_data:
             self._vc_data[guild_id] = {}
         self._vc_data[guild_id][channel_id] = settings
+        self.storage.set('voice_channels', guild_id, channel_id, settings)
         
     def remove_voice_channel(self, guild_id: str, channel_id: int) -> bool:
         if guild_id in self._vc_data:
-            return self._vc_data[guild_id].pop(channel_id, None) is not None
+            if self._vc_data[guild_id].pop(channel_id, None) is not None:
+                self.storage.delete('voice_channels', guild_id, channel_id)
+                return True
         return False
         
     def get_voice_settings(self, guild_id: str, channel_id: int) -> Dict:
@@ -105,12 +258,20 @@ class VoiceAPI:
         try:
             await member.move_to(channel)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
             
     async def disconnect_member(self, member: discord.Member) -> bool:
         try:
             await member.move_to(None)
             return True
-        except:
+        except Exception as error:
+            metrics.record_error(error)
             return False
+            
+    async def mass_move(self, members: List[discord.Member], channel: Optional[discord.VoiceChannel], concurrency: int = 5) -> Dict:
+        return await run_batch(members, lambda member: self.move_member(member, channel), concurrency)
+        
+    async def mass_disconnect(self, members: List[discord.Member], concurrency: int = 5) -> Dict:
+        return await run_batch(members, self.disconnect_member, concurrency)
@@ -0,0 +1,171 @@
+import datetime
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+from .storage import Storage
+
+def _epoch(timestamp) -> int:
+    if isinstance(timestamp, str):
+        return int(datetime.datetime.fromisoformat(timestamp).timestamp())
+    return int(timestamp)
+
+class EscalationRule:
+    __slots__ = ('count', 'window', 'action', 'duration')
+
+    ACTIONS = ('mute', 'timeout', 'kick', 'ban')
+
+    def __init__(self, count: int, window: int, action: str, duration: Optional[int] = None):
+        if action not in self.ACTIONS:
+            raise ValueError(f"Unknown escalation action: {action}")
+        self.count = int(count)
+        self.window = int(window)
+        self.action = action
+        self.duration = duration
+
+    def to_dict(self) -> Dict:
+        return {'count': self.count, 'window': self.window, 'action': self.action, 'duration': self.duration}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EscalationRule':
+        return cls(data['count'], data['window'], data['action'], data.get('duration'))
+
+class _GuildWarns:
+    __slots__ = ('timestamps', 'user_ids', 'moderator_ids', 'reasons', 'live', 'times', 'order', 'by_user')
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.user_ids = array('Q')
+        self.moderator_ids = array('Q')
+        self.reasons = []
+        self.live = bytearray()
+        self.times = array('q')
+        self.order = array('L')
+        self.by_user = {}
+
+    @staticmethod
+    def _insert(times: array, rows: array, timestamp: int, row: int) -> None:
+        if not times or timestamp >= times[-1]:
+            times.append(timestamp)
+            rows.append(row)
+        else:
+            position = bisect_right(times, timestamp)
+            times.insert(position, timestamp)
+            rows.insert(position, row)
+
+    def append(self, user_id: int, moderator_id: int, reason: str, timestamp: int) -> None:
+        row = len(self.timestamps)
+        self.timestamps.append(timestamp)
+        self.user_ids.append(user_id)
+        self.moderator_ids.append(moderator_id)
+        self.reasons.append(reason)
+        self.live.append(1)
+        self._insert(self.times, self.order, timestamp, row)
+
+        index = self.by_user.get(user_id)
+        if index is None:
+            index = self.by_user[user_id] = (array('q'), array('L'))
+        self._insert(index[0], index[1], timestamp, row)
+
+    def row(self, row: int) -> Dict:
+        return {
+            'user_id': self.user_ids[row],
+            'moderator_id': self.moderator_ids[row],
+            'reason': self.reasons[row],
+            'timestamp': self.timestamps[row]
+        }
+
+class WarnLedger:
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage = storage or Storage()
+        self._guilds = {}
+
+    def _guild(self, guild_id: int) -> _GuildWarns:
+        warns = self._guilds.get(guild_id)
+        if warns is None:
+            warns = self._guilds[guild_id] = _GuildWarns()
+        return warns
+
+    def add(self, guild_id: int, user_id: int, moderator_id: int, reason: str, timestamp: Optional[int] = None) -> int:
+        guild_id, user_id = int(guild_id), int(user_id)
+        warns = self._guild(guild_id)
+        warns.append(user_id, int(moderator_id), reason, int(time.time()) if timestamp is None else int(timestamp))
+        self._persist(guild_id, user_id)
+        return len(warns.by_user[user_id][1])
+
+    def _persist(self, guild_id: int, user_id: int) -> None:
+        warns = self._guilds[guild_id]
+        self.storage.set('warns', guild_id, user_id, [
+            {
+                'reason': warns.reasons[row],
+                'timestamp': warns.timestamps[row],
+                'moderator_id': warns.moderator_ids[row]
+            }
+            for row in warns.by_user[user_id][1]
+        ])
+
+    def get(self, guild_id: int, user_id: int) -> List[Dict]:
+        warns = self._guilds.get(int(guild_id))
+        index = warns and warns.by_user.get(int(user_id))
+        if not index:
+            return []
+        return [warns.row(row) for row in index[1]]
+
+    def clear(self, guild_id: int, user_id: int) -> bool:
+        guild_id, user_id = int(guild_id), int(user_id)
+        warns = self._guilds.get(guild_id)
+        index = warns and warns.by_user.pop(user_id, None)
+        if not index:
+            return False
+        for row in index[1]:
+            warns.live[row] = 0
+        self.storage.delete('warns', guild_id, user_id)
+        return True
+
+    def count(self, guild_id: int, user_id: int, since: Optional[int] = None, until: Optional[int] = None) -> int:
+        warns = self._guilds.get(int(guild_id))
+        index = warns and warns.by_user.get(int(user_id))
+        if not index:
+            return 0
+        timestamps = index[0]
+        start = 0 if since is None else bisect_left(timestamps, since)
+        end = len(timestamps) if until is None else bisect_right(timestamps, until)
+        return max(end - start, 0)
+
+    def range(self, guild_id: int, since: Optional[int] = None, until: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict]:
+        warns = self._guilds.get(int(guild_id))
+        if warns is None:
+            return []
+
+        if user_id is not None:
+            index = warns.by_user.get(int(user_id))
+            if not index:
+                return []
+            timestamps, rows = index
+        else:
+            timestamps, rows = warns.times, warns.order
+
+        start = 0 if since is None else bisect_left(timestamps, since)
+        end = len(timestamps) if until is None else bisect_right(timestamps, until)
+        return [warns.row(row) for row in rows[start:end] if warns.live[row]]
+
+    def users(self, guild_id: int) -> Iterable[int]:
+        warns = self._guilds.get(int(guild_id))
+        return list(warns.by_user) if warns else []
+
+    async def load(self) -> None:
+        self._guilds = {}
+        for guild_id, entries in (await self.storage.load('warns')).items():
+            rows = sorted(
+                (
+                    (_epoch(warn['timestamp']), int(user_id), int(warn.get('moderator_id') or 0), warn.get('reason'))
+                    for user_id, user_warns in entries.items()
+                    for warn in user_warns
+                ),
+                key=lambda row: row[0]
+            )
+            if not rows:
+                continue
+            warns = self._guild(int(guild_id))
+            for timestamp, user_id, moderator_id, reason in rows:
+                warns.append(user_id, moderator_id, reason, timestamp)
@@ -0,0 +1,52 @@
+import random
+import string
+import time
+from typing import Dict, List
+from Vile.message_api import _AutoresponderMatcher
+
+class _Automaton(_AutoresponderMatcher):
+    __slots__ = ()
+    SCAN_THRESHOLD = 0
+
+def _word(rng: random.Random) -> str:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+def _naive(triggers: Dict[str, str], content: str) -> List[str]:
+    return [trigger for trigger in triggers if trigger.lower() in content]
+
+def _measure(name: str, match, messages: List[str], repeat: int) -> Dict:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for content in messages:
+            match(content)
+    elapsed = time.perf_counter() - started
+    events = len(messages) * repeat
+    return {'name': name, 'events': events, 'elapsed': elapsed, 'throughput': events / elapsed}
+
+def run(sizes=(10, 100, 1000), messages: int = 2000, repeat: int = 3, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        triggers = {f"{_word(rng)} {_word(rng)}" if rng.random() < 0.3 else _word(rng): 'response' for _ in range(size)}
+        pool = list(triggers)
+        contents = []
+        for _ in range(messages):
+            words = [_word(rng) for _ in range(rng.randint(5, 40))]
+            if rng.random() < 0.2:
+                words.insert(rng.randrange(len(words)), rng.choice(pool))
+            contents.append(' '.join(words))
+
+        matcher = _AutoresponderMatcher(triggers)
+        automaton = _Automaton(triggers)
+
+        for content in contents:
+            assert sorted(matcher.match(content)) == sorted(automaton.match(content)) == sorted(_naive(triggers, content))
+
+        results.append(_measure(f"autoresponders.naive[{size}]", lambda content: _naive(triggers, content), contents, repeat))
+        results.append(_measure(f"autoresponders.matcher[{size}]", matcher.match, contents, repeat))
+        results.append(_measure(f"autoresponders.aho_corasick[{size}]", automaton.match, contents, repeat))
+    return results
+
+if __name__ == '__main__':
+    for result in run():
+        print(f"{result['name']:<36} {result['throughput']:>12,.0f} msg/s")
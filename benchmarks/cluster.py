@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+from Vile.cluster import IPCBus, ShardedStorage, find_user, global_stats, register_default_handlers
+from Vile.instrumentation import metrics
+from Vile.message_api import MessageAPI
+from Vile.role_api import RoleAPI
+from Vile.storage import SQLiteStorage
+from Vile.voice_api import VoiceAPI
+from .fake_rest import FakeRESTServer
+from .fakes import FakeBot, FakeMessage, FakeREST, snowflake
+
+EMOJIS = ('🔴', '🟢', '🔵')
+
+def _guild_ids(guilds: int) -> List[int]:
+    return [snowflake(sequence) for sequence in range(1, guilds + 1)]
+
+async def seed(path: str, guilds: int) -> None:
+    storage = SQLiteStorage(path)
+    bot = FakeBot(None)
+    messages, roles, voice = MessageAPI(bot, storage), RoleAPI(bot, storage), VoiceAPI(bot, storage)
+    for index, guild_id in enumerate(_guild_ids(guilds)):
+        if index % 5 == 0:
+            await messages.add_autoresponder(str(guild_id), 'hello', 'hi there')
+        for position, emoji in enumerate(EMOJIS):
+            await roles.setup_reaction_role(guild_id + 1, emoji, guild_id + 10 + position, 'colour', guild_id=guild_id)
+        await roles.setup_autorole(str(guild_id), guild_id + 20)
+        await voice.setup_voice_role(str(guild_id), guild_id + 30, guild_id + 21)
+    await storage.close()
+
+def _build_guild(bot: FakeBot, guild_id: int, members: int):
+    guild = bot.add_guild(guild_id=guild_id)
+    for role_id in (guild_id + 10, guild_id + 11, guild_id + 12, guild_id + 20, guild_id + 21):
+        guild.add_role(role_id=role_id)
+    channel = guild.add_text_channel()
+    lounge = guild.add_voice_channel('Lounge', guild_id + 30)
+    return guild, channel, lounge, [guild.add_member() for _ in range(members)]
+
+async def _feed(apis, guilds, rng: random.Random, events: int, batch: int) -> int:
+    messages, roles, voice = apis
+    dispatched = 0
+    while dispatched < events:
+        tasks = []
+        for _ in range(min(batch, events - dispatched)):
+            guild, channel, lounge, members = rng.choice(guilds)
+            member = rng.choice(members)
+            kind = rng.random()
+            if kind < 0.8:
+                content = rng.choice(('hello world', 'gg', 'anyone around?', 'lol'))
+                tasks.append(messages.handle_message(FakeMessage(snowflake(), content, member, channel)))
+            elif kind < 0.9:
+                tasks.append(roles.handle_reaction_add(member, guild.id + 1, rng.choice(EMOJIS)))
+            elif kind < 0.95:
+                joined = guild.add_member()
+                members.append(joined)
+                tasks.append(roles.handle_member_join(joined))
+            elif member.voice is None:
+                member.connect(lounge)
+                tasks.append(voice.handle_voice_join(member, lounge))
+            else:
+                member.connect(None)
+                tasks.append(voice.handle_voice_leave(member, lounge))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        dispatched += len(tasks)
+        await asyncio.sleep(0)
+    return dispatched
+
+async def _wait_for_peers(bus: IPCBus, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while len(await bus.broadcast('stats')) < bus.cluster_count:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Cluster workers did not come up")
+        await asyncio.sleep(0.1)
+
+async def worker(cluster_id: int, shard_ids: List[int], shard_count: int, bus: IPCBus, path: str, result_dir: str, guilds: int, members: int, events: int, batch: int) -> None:
+    metrics.enable()
+    storage = ShardedStorage(SQLiteStorage(path), shard_ids, shard_count)
+    async with FakeRESTServer(latency=0.005, bucket_limit=50) as server:
+        rest = FakeREST(server.url)
+        bot = FakeBot(rest)
+        bot.shard_ids = shard_ids
+        register_default_handlers(bus, bot)
+        apis = (MessageAPI(bot, storage), RoleAPI(bot, storage, reaction_window=0.05), VoiceAPI(bot, storage, voice_window=0.05))
+        for api in apis:
+            await api.load_state()
+        owned = [_build_guild(bot, guild_id, members) for guild_id in _guild_ids(guilds) if storage.owns(guild_id)]
+
+        done = asyncio.Event()
+
+        async def finish(payload) -> bool:
+            done.set()
+            return True
+
+        bus.register('done', finish)
+        await _wait_for_peers(bus)
+
+        started = time.perf_counter()
+        dispatched = await _feed(apis, owned, random.Random(cluster_id), events, batch)
+        await rest.settle(lambda: apis[1].reaction_edits._pending, lambda: apis[1]._join_workers)
+        elapsed = time.perf_counter() - started
+        await rest.close()
+
+        result = {
+            'cluster_id': cluster_id,
+            'shard_ids': shard_ids,
+            'guilds': len(owned),
+            'reaction_messages': len(apis[1]._reaction_roles),
+            'events': dispatched,
+            'elapsed': elapsed,
+            'throughput': dispatched / elapsed,
+            'rest_requests': server.requests,
+            'rate_limited': server.rate_limited,
+            'errors': dict(metrics.errors)
+        }
+
+        if cluster_id == 0:
+            await _wait_for_peers(bus)
+            started = time.perf_counter()
+            result['global_stats'] = await global_stats(bus)
+            user_id = owned[0][3][0].id if owned else 0
+            result['find_user'] = await find_user(bus, user_id) is not None
+            result['ipc_elapsed'] = time.perf_counter() - started
+            await bus.broadcast('done')
+        else:
+            await asyncio.wait_for(done.wait(), 60)
+
+    with open(os.path.join(result_dir, f'result-{cluster_id}.json'), 'w') as file:
+        json.dump(result, file)
+    await storage.close()
+
+def run(clusters: int = 2, shards: int = 4, guilds: int = 200, members: int = 20, events: int = 5000, batch: int = 250) -> List[Dict]:
+    from Vile.cluster import run_cluster
+
+    directory = tempfile.mkdtemp(prefix='vile-cluster-')
+    path = os.path.join(directory, 'state.db')
+    asyncio.run(seed(path, guilds))
+    setup = functools.partial(worker, path=path, result_dir=directory, guilds=guilds, members=members, events=events, batch=batch)
+    try:
+        run_cluster(setup, shards, clusters, socket_dir=directory)
+        results = []
+        for cluster_id in range(clusters):
+            with open(os.path.join(directory, f'result-{cluster_id}.json')) as file:
+                results.append(json.load(file))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clusters', type=int, default=2)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--guilds', type=int, default=200)
+    parser.add_argument('--events', type=int, default=5000)
+    args = parser.parse_args()
+
+    results = run(args.clusters, args.shards, args.guilds, events=args.events)
+    for result in results:
+        print(
+            f"cluster {result['cluster_id']} shards {result['shard_ids']}: {result['guilds']} guilds, "
+            f"{result['reaction_messages']} reaction messages, {result['throughput']:,.0f} ev/s, "
+            f"{result['rest_requests']} REST, {result['rate_limited']} 429s"
+        )
+    stats = results[0]['global_stats']
+    print(f"global: {stats['clusters']} clusters, {stats['guilds']} guilds, {stats['members']} members, "
+          f"find_user={results[0]['find_user']} in {results[0]['ipc_elapsed'] * 1000:.1f} ms")
+    print(f"total: {sum(result['throughput'] for result in results):,.0f} ev/s")
@@ -0,0 +1,91 @@
+import asyncio
+import re
+import time
+from typing import Dict, Optional
+from aiohttp import web
+
+_MAJOR = re.compile(r'^/(guilds|channels|webhooks)/(\d+)')
+_SNOWFLAKE = re.compile(r'/\d+')
+
+def bucket_for(method: str, path: str) -> str:
+    match = _MAJOR.match(path)
+    major = match.group(0) if match else ''
+    return f"{method} {major}{_SNOWFLAKE.sub('/:id', path[len(major):])}"
+
+class FakeRESTServer:
+    def __init__(self, latency: float = 0.005, bucket_limit: int = 5, bucket_window: float = 1.0, host: str = '127.0.0.1'):
+        self.latency = latency
+        self.bucket_limit = bucket_limit
+        self.bucket_window = bucket_window
+        self.host = host
+        self.url = None
+        self.requests = 0
+        self.rate_limited = 0
+        self.routes = {}
+        self._buckets = {}
+        self._next_id = 1 << 40
+        self._runner = None
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.rate_limited = 0
+        self.routes = {}
+        self._buckets = {}
+
+    def _take(self, bucket: str) -> Optional[float]:
+        now = time.monotonic()
+        window = self._buckets.get(bucket)
+        if window is None or now >= window[0]:
+            window = self._buckets[bucket] = [now + self.bucket_window, self.bucket_limit]
+        if window[1] <= 0:
+            return window[0] - now
+        window[1] -= 1
+        return None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        bucket = bucket_for(request.method, request.path)
+        self.routes[bucket] = self.routes.get(bucket, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        retry_after = self._take(bucket)
+        if retry_after is not None:
+            self.rate_limited += 1
+            return web.json_response(
+                {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': False},
+                status=429,
+                headers={'Retry-After': f'{retry_after:.3f}', 'X-RateLimit-Bucket': bucket}
+            )
+
+        remaining, reset = self._buckets[bucket][1], self._buckets[bucket][0] - time.monotonic()
+        headers = {'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset-After': f'{reset:.3f}'}
+        if request.method == 'POST':
+            self._next_id += 1
+            return web.json_response({'id': str(self._next_id)}, headers=headers)
+        return web.Response(status=204, headers=headers)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.url = f'http://{self.host}:{site._server.sockets[0].getsockname()[1]}'
+        return self.url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> 'FakeRESTServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def stats(self) -> Dict:
+        return {'requests': self.requests, 'rate_limited': self.rate_limited, 'routes': dict(self.routes)}
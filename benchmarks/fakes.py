@@ -0,0 +1,290 @@
+import asyncio
+import datetime
+import itertools
+import time
+from typing import Dict, Iterable, List, Optional
+import aiohttp
+import discord
+from Vile.instrumentation import metrics
+from .fake_rest import bucket_for
+
+_ids = itertools.count(1)
+
+def snowflake(sequence: Optional[int] = None) -> int:
+    return ((next(_ids) if sequence is None else sequence) << 22) | 1
+
+class FakeREST:
+    def __init__(self, url: str, max_retries: int = 5):
+        self.url = url
+        self.max_retries = max_retries
+        self.calls = 0
+        self.in_flight = 0
+        self._session = None
+
+    async def request(self, method: str, path: str, json: Optional[Dict] = None) -> Optional[Dict]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        self.calls += 1
+        self.in_flight += 1
+        route = bucket_for(method, path)
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                async with self._session.request(method, self.url + path, json=json) as response:
+                    if response.status == 429 and attempt < self.max_retries:
+                        await asyncio.sleep(float(response.headers.get('Retry-After', 1)))
+                        continue
+                    if metrics.enabled:
+                        metrics.observe_route(route, time.perf_counter() - started, response.status)
+                    if response.status >= 400:
+                        raise discord.HTTPException(response, await response.text())
+                    if response.status == 204:
+                        return None
+                    return await response.json()
+        finally:
+            self.in_flight -= 1
+
+    async def settle(self, *busy, interval: float = 0.01) -> None:
+        while self.in_flight or any(check() for check in busy):
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+class FakeRole:
+    __slots__ = ('id', 'guild', 'name')
+
+    def __init__(self, role_id: int, guild: 'FakeGuild', name: str = 'role'):
+        self.id = role_id
+        self.guild = guild
+        self.name = name
+
+    @property
+    def mention(self) -> str:
+        return f'<@&{self.id}>'
+
+    def is_default(self) -> bool:
+        return self.id == self.guild.id
+
+    def is_assignable(self) -> bool:
+        return not self.is_default()
+
+class FakeVoiceState:
+    __slots__ = ('channel',)
+
+    def __init__(self, channel: Optional['FakeVoiceChannel'] = None):
+        self.channel = channel
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: 'FakeGuild', roles: Iterable[FakeRole] = (), bot: bool = False):
+        self.id = member_id
+        self.guild = guild
+        self.name = f'user{member_id & 0xffff}'
+        self.display_name = self.name
+        self.discriminator = '0'
+        self.nick = None
+        self.avatar = None
+        self.bot = bot
+        self.voice = None
+        self.created_at = discord.utils.snowflake_time(member_id)
+        self.joined_at = discord.utils.utcnow()
+        self.premium_since = None
+        self._roles = {role.id: role for role in roles}
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.id}>'
+
+    @property
+    def roles(self) -> List[FakeRole]:
+        return [self.guild.default_role, *self._roles.values()]
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+    @property
+    def _path(self) -> str:
+        return f'/guilds/{self.guild.id}/members/{self.id}'
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None, atomic: bool = True) -> None:
+        if atomic:
+            for role in roles:
+                await self.guild.rest.request('PUT', f'{self._path}/roles/{role.id}')
+                self._roles[role.id] = role
+        else:
+            await self.edit(roles=[*self._roles.values(), *roles], reason=reason)
+
+    async def remove_roles(self, *roles: FakeRole, reason: Optional[str] = None, atomic: bool = True) -> None:
+        if atomic:
+            for role in roles:
+                await self.guild.rest.request('DELETE', f'{self._path}/roles/{role.id}')
+                self._roles.pop(role.id, None)
+        else:
+            removed = {role.id for role in roles}
+            await self.edit(roles=[role for role in self._roles.values() if role.id not in removed], reason=reason)
+
+    async def edit(self, *, roles: Optional[List[FakeRole]] = None, reason: Optional[str] = None) -> None:
+        roles = [role for role in roles if not role.is_default()]
+        await self.guild.rest.request('PATCH', self._path, {'roles': [str(role.id) for role in roles]})
+        self._roles = {role.id: role for role in roles}
+
+    async def move_to(self, channel: Optional['FakeVoiceChannel'], reason: Optional[str] = None) -> None:
+        await self.guild.rest.request('PATCH', self._path, {'channel_id': str(channel.id) if channel else None})
+        self.connect(channel)
+
+    def connect(self, channel: Optional['FakeVoiceChannel']) -> None:
+        if self.voice is not None and self.voice.channel is not None:
+            self.voice.channel.members.remove(self)
+        if channel is None:
+            self.voice = None
+            return
+        self.voice = FakeVoiceState(channel)
+        channel.members.append(self)
+
+    async def timeout(self, duration: datetime.timedelta, reason: Optional[str] = None) -> None:
+        until = discord.utils.utcnow() + duration
+        await self.guild.rest.request('PATCH', self._path, {'communication_disabled_until': until.isoformat()})
+
+    async def kick(self, reason: Optional[str] = None) -> None:
+        await self.guild.rest.request('DELETE', self._path)
+        self.guild.members.pop(self.id, None)
+
+    async def ban(self, reason: Optional[str] = None, delete_message_days: int = 0) -> None:
+        await self.guild.rest.request('PUT', f'/guilds/{self.guild.id}/bans/{self.id}', {'delete_message_days': delete_message_days})
+        self.guild.members.pop(self.id, None)
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int, guild: 'FakeGuild', name: str = 'general'):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+
+    @property
+    def mention(self) -> str:
+        return f'<#{self.id}>'
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None, delete_after: Optional[float] = None) -> Optional[Dict]:
+        payload = {'content': content}
+        if embed is not None:
+            payload['embeds'] = [embed.to_dict()]
+        return await self.guild.rest.request('POST', f'/channels/{self.id}/messages', payload)
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id: int, guild: 'FakeGuild', name: str = 'Voice', category=None):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.members = []
+
+    async def edit(self, *, name: Optional[str] = None, overwrites: Optional[Dict] = None, reason: Optional[str] = None) -> None:
+        await self.guild.rest.request('PATCH', f'/channels/{self.id}', {'name': name or self.name})
+        self.name = name or self.name
+
+    async def delete(self, reason: Optional[str] = None) -> None:
+        await self.guild.rest.request('DELETE', f'/channels/{self.id}')
+        self.guild.channels.pop(self.id, None)
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, author: FakeMember, channel: FakeTextChannel, mentions: Iterable[FakeMember] = ()):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.mentions = list(mentions)
+        self.raw_mentions = [member.id for member in self.mentions]
+        self.raw_role_mentions = []
+        self.mention_everyone = False
+        self.attachments = []
+        self.created_at = discord.utils.utcnow()
+
+    async def delete(self) -> None:
+        await self.guild.rest.request('DELETE', f'/channels/{self.channel.id}/messages/{self.id}')
+
+class FakeGuild:
+    def __init__(self, guild_id: int, rest: FakeREST, name: str = 'guild'):
+        self.id = guild_id
+        self.rest = rest
+        self.name = name
+        self.members = {}
+        self.channels = {}
+        self._roles = {guild_id: FakeRole(guild_id, self, '@everyone')}
+
+    @property
+    def default_role(self) -> FakeRole:
+        return self._roles[self.id]
+
+    @property
+    def roles(self) -> List[FakeRole]:
+        return list(self._roles.values())
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def add_role(self, name: str = 'role', role_id: Optional[int] = None) -> FakeRole:
+        role = FakeRole(role_id or snowflake(), self, name)
+        self._roles[role.id] = role
+        return role
+
+    def add_member(self, roles: Iterable[FakeRole] = (), bot: bool = False) -> FakeMember:
+        member = FakeMember(snowflake(), self, roles, bot)
+        self.members[member.id] = member
+        return member
+
+    def add_text_channel(self, name: str = 'general') -> FakeTextChannel:
+        channel = FakeTextChannel(snowflake(), self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_voice_channel(self, name: str = 'Voice', channel_id: Optional[int] = None) -> FakeVoiceChannel:
+        channel = FakeVoiceChannel(channel_id or snowflake(), self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def create_voice_channel(self, name: str, *, category=None, bitrate: int = 64000, user_limit: int = 0, overwrites: Optional[Dict] = None, reason: Optional[str] = None) -> FakeVoiceChannel:
+        data = await self.rest.request('POST', f'/guilds/{self.id}/channels', {'name': name, 'type': 2, 'bitrate': bitrate, 'user_limit': user_limit})
+        return self.add_voice_channel(name, int(data['id']))
+
+class FakeBot:
+    def __init__(self, rest: FakeREST):
+        self.rest = rest
+        self.guilds = []
+        self._guilds = {}
+        self.latency = 0.0
+        self.user = None
+
+    def add_guild(self, name: str = 'guild', guild_id: Optional[int] = None) -> FakeGuild:
+        guild = FakeGuild(guild_id or snowflake(), self.rest, name)
+        self.guilds.append(guild)
+        self._guilds[guild.id] = guild
+        return guild
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self._guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int):
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                return channel
+        return None
+
+    def get_user(self, user_id: int) -> Optional[FakeMember]:
+        for guild in self.guilds:
+            member = guild.get_member(user_id)
+            if member is not None:
+                return member
+        return None
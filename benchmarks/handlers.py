@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+from typing import Dict, List
+from Vile.instrumentation import Benchmark, compare_baseline, metrics, save_baseline
+from Vile.message_api import MessageAPI
+from Vile.role_api import RoleAPI
+from Vile.voice_api import VoiceAPI
+from .fake_rest import FakeRESTServer
+from .fakes import FakeBot, FakeMessage, FakeREST, snowflake
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+async def _dispatch(handler, events: List[tuple]) -> None:
+    await asyncio.gather(*(handler(*event) for event in events))
+
+def _result(bench: Benchmark, events: int, server: FakeRESTServer) -> Dict:
+    result = bench.result(events)
+    result['rest_requests'] = server.requests
+    result['rate_limited'] = server.rate_limited
+    result['errors'] = dict(metrics.errors)
+    return result
+
+async def message_scenario(server: FakeRESTServer, rng: random.Random, guilds: int = 200, configured: int = 10, messages: int = 5000) -> Dict:
+    rest = FakeREST(server.url)
+    bot = FakeBot(rest)
+    api = MessageAPI(bot)
+    channels, members = [], []
+    for index in range(guilds):
+        guild = bot.add_guild(f'guild{index}')
+        channels.append(guild.add_text_channel())
+        members.append([guild.add_member() for _ in range(20)])
+        if index < configured:
+            for trigger in ('hello there', 'rules', 'help me', 'ping'):
+                await api.add_autoresponder(str(guild.id), trigger, f'auto: {trigger}')
+            await api.set_spam_settings(str(guild.id), {'enabled': True, 'message_limit': 8, 'interval': 5, 'action': 'delete'})
+    afk = [member for guild_members in members[:configured] for member in guild_members[:2]]
+    for member in afk:
+        await api.set_afk(member.id, 'away')
+
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'hello there', 'ping', 'rules']
+    events = []
+    for _ in range(messages):
+        index = rng.randrange(configured) if rng.random() < 0.1 else rng.randrange(guilds)
+        author = rng.choice(members[index][2:])
+        mentions = [rng.choice(afk)] if rng.random() < 0.01 else []
+        content = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 12)))
+        events.append((FakeMessage(snowflake(), content, author, channels[index], mentions),))
+
+    server.reset()
+    with Benchmark('handlers.handle_message') as bench:
+        await _dispatch(api.handle_message, events)
+        await rest.settle()
+    await rest.close()
+    return _result(bench, len(events), server)
+
+async def reaction_scenario(server: FakeRESTServer, rng: random.Random, guilds: int = 5, members: int = 40) -> Dict:
+    rest = FakeREST(server.url)
+    bot = FakeBot(rest)
+    api = RoleAPI(bot, reaction_window=0.05)
+    emojis = ['🔴', '🟢', '🔵', '⭐', '🎮', '🎵']
+    setups = []
+    for index in range(guilds):
+        guild = bot.add_guild(f'guild{index}')
+        message_id = snowflake()
+        for position, emoji in enumerate(emojis):
+            role = guild.add_role(emoji)
+            await api.setup_reaction_role(message_id, emoji, role.id, 'colour' if position < 3 else None, guild_id=guild.id)
+        setups.append((guild, message_id, [guild.add_member() for _ in range(members)]))
+
+    events = []
+    for guild, message_id, guild_members in setups:
+        for member in guild_members:
+            events.extend((member, message_id, rng.choice(emojis)) for _ in range(3))
+
+    server.reset()
+    with Benchmark('handlers.handle_reaction_add') as bench:
+        await _dispatch(api.handle_reaction_add, events)
+        await rest.settle(lambda: api.reaction_edits._pending)
+    await rest.close()
+    return _result(bench, len(events), server)
+
+async def member_join_scenario(server: FakeRESTServer, rng: random.Random, guilds: int = 3, joins: int = 40) -> Dict:
+    rest = FakeREST(server.url)
+    bot = FakeBot(rest)
+    api = RoleAPI(bot)
+    api.join_wave_rate = 50
+    events = []
+    for index in range(guilds):
+        guild = bot.add_guild(f'guild{index}')
+        for _ in range(2):
+            await api.setup_autorole(str(guild.id), guild.add_role('autorole').id)
+        kept = [guild.add_role('kept') for _ in range(4)]
+        for _ in range(joins):
+            member = guild.add_member(rng.sample(kept, 2) if rng.random() < 0.5 else ())
+            await api.handle_member_remove(member)
+            member._roles = {}
+            events.append((member,))
+    rng.shuffle(events)
+
+    server.reset()
+    with Benchmark('handlers.handle_member_join') as bench:
+        await _dispatch(api.handle_member_join, events)
+        await rest.settle(lambda: api._join_workers)
+    await rest.close()
+    result = _result(bench, len(events), server)
+    result['join_requests'] = api.join_requests
+    return result
+
+async def voice_scenario(server: FakeRESTServer, rng: random.Random, guilds: int = 3, members: int = 30) -> Dict:
+    rest = FakeREST(server.url)
+    bot = FakeBot(rest)
+    api = VoiceAPI(bot, voice_window=0.05)
+    setups = []
+    for index in range(guilds):
+        guild = bot.add_guild(f'guild{index}')
+        lounge = guild.add_voice_channel('Lounge')
+        hub = guild.add_voice_channel('Join to create')
+        await api.setup_voice_role(str(guild.id), lounge.id, guild.add_role('in voice').id)
+        await api.setup_voice_channel(str(guild.id), hub.id, {'auto_create': True, 'grace_period': 0.05, 'pool_size': 2})
+        setups.append((guild, lounge, hub, [guild.add_member() for _ in range(members)]))
+
+    async def session(member, lounge, hub) -> None:
+        member.connect(lounge)
+        await api.handle_voice_join(member, lounge)
+        if rng.random() < 0.3:
+            member.connect(None)
+            await api.handle_voice_leave(member, lounge)
+        if rng.random() < 0.3:
+            previous = member.voice.channel if member.voice else None
+            member.connect(hub)
+            if previous is not None:
+                await api.handle_voice_leave(member, previous)
+            await api.handle_voice_join(member, hub)
+            temp = member.voice.channel
+            member.connect(None)
+            await api.handle_voice_leave(member, temp)
+
+    events = [(member, lounge, hub) for guild, lounge, hub, guild_members in setups for member in guild_members]
+    server.reset()
+    with Benchmark('handlers.voice') as bench:
+        await _dispatch(session, events)
+        await rest.settle(lambda: api.voice_role_edits._pending, lambda: api._pending_deletes, lambda: api._pool_refills)
+    await rest.close()
+    calls = sum(histogram.count for name, histogram in metrics.methods.items() if name.startswith('VoiceAPI.handle_voice'))
+    return _result(bench, calls, server)
+
+SCENARIOS = (message_scenario, reaction_scenario, member_join_scenario, voice_scenario)
+
+async def _run(latency: float, bucket_limit: int, seed: int) -> List[Dict]:
+    results = []
+    async with FakeRESTServer(latency=latency, bucket_limit=bucket_limit) as server:
+        for scenario in SCENARIOS:
+            results.append(await scenario(server, random.Random(seed)))
+    return results
+
+def run(latency: float = 0.005, bucket_limit: int = 50, seed: int = 0) -> List[Dict]:
+    return asyncio.run(_run(latency, bucket_limit, seed))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--bucket-limit', type=int, default=50)
+    args = parser.parse_args()
+
+    results = run(args.latency, args.bucket_limit)
+    for result in results:
+        print(
+            f"{result['name']:<30} {result['throughput']:>9,.0f} ev/s "
+            f"{result['rest_calls_per_event']:>6.3f} REST/ev {result['rate_limited']:>4} 429s "
+            f"{result['memory_growth'] / 1024:>8.0f} KiB"
+        )
+    if args.save:
+        save_baseline(BASELINE, results)
+    elif os.path.exists(BASELINE):
+        regressions = compare_baseline(BASELINE, results, args.tolerance)
+        for regression in regressions:
+            print(regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,66 @@
+import asyncio
+import random
+import time
+from typing import Dict, List
+from Vile.role_api import RoleAPI
+from .fake_rest import FakeRESTServer
+from .fakes import FakeBot, FakeREST
+
+class _PerRoleAPI(RoleAPI):
+    async def _apply_join_roles(self, member, roles) -> None:
+        for role in roles:
+            self.join_requests += 1
+            await member.add_roles(role, reason="Autoroles and restored roles")
+
+async def _measure(name: str, api_class, server: FakeRESTServer, joins: int, saved_roles: int, autoroles: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    rest = FakeREST(server.url)
+    bot = FakeBot(rest)
+    api = api_class(bot)
+    api.join_wave_rate = 50
+    guild = bot.add_guild()
+    for _ in range(autoroles):
+        await api.setup_autorole(str(guild.id), guild.add_role('autorole').id)
+    kept = [guild.add_role('kept') for _ in range(saved_roles * 2)]
+
+    members = []
+    for _ in range(joins):
+        member = guild.add_member(rng.sample(kept, saved_roles))
+        await api.handle_member_remove(member)
+        member._roles = {}
+        members.append(member)
+
+    server.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(api.handle_member_join(member) for member in members))
+    await rest.settle(lambda: api._join_workers)
+    elapsed = time.perf_counter() - started
+    await rest.close()
+
+    assert all(len(member._roles) == saved_roles + autoroles for member in members)
+    return {
+        'name': name,
+        'events': joins,
+        'elapsed': elapsed,
+        'throughput': joins / elapsed,
+        'requests_per_join': server.requests / joins,
+        'join_requests': api.join_requests,
+        'rate_limited': server.rate_limited
+    }
+
+async def _run(joins: int, saved_roles: int, autoroles: int, latency: float, bucket_limit: int, seed: int) -> List[Dict]:
+    async with FakeRESTServer(latency=latency, bucket_limit=bucket_limit) as server:
+        return [
+            await _measure('join_roles.per_role', _PerRoleAPI, server, joins, saved_roles, autoroles, seed),
+            await _measure('join_roles.single_call', RoleAPI, server, joins, saved_roles, autoroles, seed)
+        ]
+
+def run(joins: int = 30, saved_roles: int = 15, autoroles: int = 2, latency: float = 0.005, bucket_limit: int = 50, seed: int = 0) -> List[Dict]:
+    return asyncio.run(_run(joins, saved_roles, autoroles, latency, bucket_limit, seed))
+
+if __name__ == '__main__':
+    for result in run():
+        print(
+            f"{result['name']:<26} {result['requests_per_join']:>6.2f} requests/join "
+            f"{result['rate_limited']:>4} 429s {result['elapsed']:>7.2f}s"
+        )
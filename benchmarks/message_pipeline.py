@@ -0,0 +1,46 @@
+import asyncio
+import time
+from typing import Dict, List
+from Vile.message_api import MessageAPI
+from .fakes import FakeBot, FakeMessage, FakeREST, snowflake
+
+async def _measure(name: str, api: MessageAPI, messages: List[FakeMessage], repeat: int) -> Dict:
+    handle = api.handle_message
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            await handle(message)
+    elapsed = time.perf_counter() - started
+    events = len(messages) * repeat
+    return {
+        'name': name,
+        'events': events,
+        'elapsed': elapsed,
+        'throughput': events / elapsed,
+        'us_per_message': elapsed / events * 1e6
+    }
+
+async def _run(configured: int, afk_users: int, messages: int, repeat: int) -> List[Dict]:
+    bot = FakeBot(FakeREST('http://127.0.0.1:9'))
+    api = MessageAPI(bot)
+    for index in range(configured):
+        guild = bot.add_guild(f'configured{index}')
+        await api.add_autoresponder(str(guild.id), 'never matches here', 'response')
+
+    guild = bot.add_guild('unconfigured')
+    channel = guild.add_text_channel()
+    authors = [guild.add_member() for _ in range(50)]
+    batch = [FakeMessage(snowflake(), 'just chatting about nothing', authors[index % 50], channel) for index in range(messages)]
+
+    results = [await _measure('message_pipeline.unconfigured', api, batch, repeat)]
+    for _ in range(afk_users):
+        await api.set_afk(snowflake(), 'away')
+    results.append(await _measure('message_pipeline.unconfigured_with_afk', api, batch, repeat))
+    return results
+
+def run(configured: int = 1000, afk_users: int = 1000, messages: int = 10000, repeat: int = 5) -> List[Dict]:
+    return asyncio.run(_run(configured, afk_users, messages, repeat))
+
+if __name__ == '__main__':
+    for result in run():
+        print(f"{result['name']:<42} {result['us_per_message']:>8.2f} us/message {result['throughput']:>12,.0f} msg/s")
@@ -0,0 +1,49 @@
+import os
+import time
+from typing import Dict, List
+from Vile import roblox
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'roblox_profile.html')
+
+def _backends() -> List[str]:
+    backends = ['html.parser']
+    try:
+        import lxml
+        backends.append('lxml')
+    except ImportError:
+        pass
+    return backends
+
+def _measure(name: str, parser: str, html: str, repeat: int, passes: int = 1) -> Dict:
+    previous = roblox.HTML_PARSER
+    roblox.HTML_PARSER = parser
+    try:
+        expected = roblox.RobloxAPI.parse_profile(html, 156)
+        assert expected['username'] == 'Builderman' and expected['place_visits'] == 19845201
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for _ in range(passes):
+                roblox.RobloxAPI.parse_profile(html, 156)
+        elapsed = time.perf_counter() - started
+    finally:
+        roblox.HTML_PARSER = previous
+    return {
+        'name': name,
+        'events': repeat,
+        'elapsed': elapsed,
+        'throughput': repeat / elapsed,
+        'ms_per_profile': elapsed / repeat * 1000
+    }
+
+def run(repeat: int = 50) -> List[Dict]:
+    with open(FIXTURE, encoding='utf-8') as file:
+        html = file.read()
+
+    results = [_measure('roblox_profile.two_passes[html.parser]', 'html.parser', html, repeat, passes=2)]
+    for parser in _backends():
+        results.append(_measure(f'roblox_profile.snapshot[{parser}]', parser, html, repeat))
+    return results
+
+if __name__ == '__main__':
+    for result in run():
+        print(f"{result['name']:<42} {result['ms_per_profile']:>8.2f} ms/profile")
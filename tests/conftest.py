@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from aiohttp import web
+
+class StubServer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.delays = {}
+        self.statuses = {}
+        self.bodies = {}
+        self.hits = {}
+        self.version = 1
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        path = request.path
+        self.hits[path] = self.hits.get(path, 0) + 1
+        await asyncio.sleep(self.delays.get(path, self.delay))
+        statuses = self.statuses.get(path)
+        status = statuses.pop(0) if statuses else 200
+        headers = {'Retry-After': '0.01'} if status == 429 else {}
+        body = self.bodies.get(path)
+        if body is None:
+            body = {'name': request.query.get('username', path), 'version': self.version, 'tags': ['a', 'b']}
+        return web.json_response(body, status=status, headers=headers)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        self.runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.runner.cleanup()
+
+@pytest.fixture
+def stub_server():
+    return StubServer
@@ -0,0 +1,92 @@
+import asyncio
+from Vile.cache import TTLCache
+from Vile.http_client import HTTPClient
+from Vile.roblox import RobloxAPI
+
+def roblox_api(server, cache_size=2048, ttl=60, stale_ttl=0):
+    api = RobloxAPI(http=HTTPClient(max_retries=0), cache_size=cache_size, stale_ttl=stale_ttl)
+    api.api_url = server.url
+    api.cache_ttls = {endpoint: ttl for endpoint in api.cache_ttls}
+    return api
+
+def test_ttl_expiry_refetches(stub_server):
+    async def main():
+        async with stub_server() as server:
+            api = roblox_api(server, ttl=0.05)
+            assert (await api.get_user_by_username('alice'))['name'] == 'alice'
+            await api.get_user_by_username('ALICE')
+            assert server.hits['/users/get-by-username'] == 1
+            await asyncio.sleep(0.1)
+            await api.get_user_by_username('alice')
+            assert server.hits['/users/get-by-username'] == 2
+            await api.close()
+
+    asyncio.run(main())
+
+def test_lru_evicts_least_recently_used(stub_server):
+    async def main():
+        async with stub_server() as server:
+            api = roblox_api(server, cache_size=2)
+            await api.get_user_by_username('a')
+            await api.get_user_by_username('b')
+            await api.get_user_by_username('a')
+            await api.get_user_by_username('c')
+            assert server.hits['/users/get-by-username'] == 3
+            await api.get_user_by_username('a')
+            assert server.hits['/users/get-by-username'] == 3
+            await api.get_user_by_username('b')
+            assert server.hits['/users/get-by-username'] == 4
+            await api.close()
+
+    asyncio.run(main())
+
+def test_concurrent_misses_share_one_request(stub_server):
+    async def main():
+        async with stub_server(delay=0.05) as server:
+            api = roblox_api(server)
+            results = await asyncio.gather(*(api.get_user_by_username('alice') for _ in range(50)))
+            assert server.hits['/users/get-by-username'] == 1
+            assert all(result == results[0] for result in results)
+            assert len({id(result) for result in results}) == 50
+            await api.close()
+
+    asyncio.run(main())
+
+def test_stale_value_served_while_revalidating(stub_server):
+    async def main():
+        async with stub_server(delay=0.05) as server:
+            api = roblox_api(server, ttl=0.3, stale_ttl=10)
+            assert (await api.get_user_by_username('alice'))['version'] == 1
+            server.version = 2
+            await asyncio.sleep(0.35)
+
+            stale = await asyncio.wait_for(api.get_user_by_username('alice'), 0.02)
+            assert stale['version'] == 1
+            assert api.cache_stats()['stale_hits'] == 1
+            await asyncio.sleep(0.1)
+            assert (await api.get_user_by_username('alice'))['version'] == 2
+            assert server.hits['/users/get-by-username'] == 2
+            await api.close()
+
+    asyncio.run(main())
+
+def test_mutating_result_does_not_corrupt_cache(stub_server):
+    async def main():
+        async with stub_server() as server:
+            api = roblox_api(server)
+            first = await api.get_user_by_username('alice')
+            first['name'] = 'mallory'
+            first['tags'].append('c')
+            second = await api.get_user_by_username('alice')
+            assert second == {'name': 'alice', 'version': 1, 'tags': ['a', 'b']}
+            await api.close()
+
+    asyncio.run(main())
+
+def test_set_stores_a_copy():
+    cache = TTLCache(copy=lambda value: dict(value))
+    value = {'a': 1}
+    cache.set('key', value, 60)
+    value['a'] = 2
+    assert cache.get('key') == {'a': 1}
+    assert 'key' in cache
@@ -0,0 +1,55 @@
+import asyncio
+from benchmarks.fakes import FakeBot
+from Vile.cluster import IPCBus, ShardedStorage, shard_for
+from Vile.role_api import RoleAPI
+from Vile.storage import SQLiteStorage
+
+def test_reaction_roles_are_partitioned_by_guild(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'))
+        guilds = [1 << 22, 2 << 22]
+        assert [shard_for(guild_id, 2) for guild_id in guilds] == [1, 0]
+
+        writer = RoleAPI(FakeBot(None), storage)
+        await writer.setup_reaction_role(100, '👍', 5, guild_id=guilds[0])
+        await writer.setup_reaction_role(200, '👍', 6, guild_id=guilds[1])
+        await storage.flush()
+
+        worker = RoleAPI(FakeBot(None), ShardedStorage(storage, [0], 2))
+        await worker.load_state()
+        assert worker.get_reaction_role(100, '👍') is None
+        assert worker.get_reaction_role(200, '👍') == 6
+        await storage.close()
+
+    asyncio.run(main())
+
+def test_dispatch_tasks_are_tracked_until_done(tmp_path):
+    async def main():
+        first = IPCBus(0, 2, str(tmp_path))
+        second = IPCBus(1, 2, str(tmp_path))
+        release = asyncio.Event()
+
+        async def slow(payload):
+            await release.wait()
+            return payload
+
+        second.register('slow', slow)
+        await first.start()
+        await second.start()
+
+        request = asyncio.ensure_future(first.request(1, 'slow', 7))
+        for _ in range(100):
+            if second._dispatches:
+                break
+            await asyncio.sleep(0.01)
+        assert len(second._dispatches) == 1
+
+        release.set()
+        assert await request == 7
+        await asyncio.sleep(0)
+        assert not second._dispatches
+
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import asyncio
+import datetime
+import types
+from Vile.discord_api import DiscordAPI
+
+def make_user(user_id, banner=None):
+    return types.SimpleNamespace(
+        id=user_id,
+        name=f'user{user_id}',
+        discriminator='0',
+        avatar=None,
+        banner=types.SimpleNamespace(url=banner) if banner else None,
+        bot=False,
+        created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+
+class FakeBot:
+    def __init__(self):
+        self.fetches = 0
+        self.cached = {1: make_user(1)}
+
+    def get_user(self, user_id):
+        return self.cached.get(user_id)
+
+    async def fetch_user(self, user_id):
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        return make_user(user_id, banner=f'https://cdn/banners/{user_id}.png')
+
+def test_fetch_user_data_keeps_banner_by_default():
+    async def main():
+        bot = FakeBot()
+        api = DiscordAPI(bot)
+        data = await api.fetch_user_data(1)
+        assert data['banner_url'] == 'https://cdn/banners/1.png'
+        results = await asyncio.gather(*(api.fetch_user_data(2) for _ in range(10)))
+        assert bot.fetches == 2
+        assert all(result == results[0] for result in results)
+
+        gateway = await api.fetch_user_data(1, use_gateway=True)
+        assert gateway['banner_url'] is None
+        assert bot.fetches == 2
+        await api.close()
+
+    asyncio.run(main())
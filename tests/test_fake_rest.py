@@ -0,0 +1,18 @@
+import asyncio
+from benchmarks.fake_rest import FakeRESTServer, bucket_for
+from benchmarks.fakes import FakeREST
+
+def test_bucket_keeps_major_parameter():
+    assert bucket_for('PUT', '/guilds/11/members/22/roles/33') == 'PUT /guilds/11/members/:id/roles/:id'
+
+def test_rate_limited_requests_are_retried_after_retry_after():
+    async def main():
+        async with FakeRESTServer(latency=0, bucket_limit=2, bucket_window=0.2) as server:
+            rest = FakeREST(server.url)
+            results = await asyncio.gather(*(rest.request('POST', '/channels/1/messages', {'content': 'hi'}) for _ in range(4)))
+            await rest.close()
+        assert all(result['id'] for result in results)
+        assert server.rate_limited >= 2
+        assert server.requests == 4 + server.rate_limited
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import asyncio
+import aiohttp
+import pytest
+from Vile.http_client import HTTPClient
+
+def client():
+    return HTTPClient(max_retries=3, backoff_base=0.001)
+
+def test_cancelled_request_releases_in_flight(stub_server):
+    async def main():
+        async with stub_server() as server:
+            server.delays['/slow'] = 5
+            http = client()
+
+            async def fetch():
+                async with http.get(f'{server.url}/slow'):
+                    pass
+
+            task = asyncio.ensure_future(fetch())
+            await asyncio.sleep(0.1)
+            assert http.metrics()['in_flight'] == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert http.metrics()['in_flight'] == 0
+            await http.close()
+
+    asyncio.run(main())
+
+def test_client_errors_release_in_flight():
+    async def main():
+        http = client()
+        with pytest.raises(aiohttp.ClientError):
+            async with http.get('ftp://127.0.0.1/file'):
+                pass
+        assert http.metrics()['in_flight'] == 0
+        await http.close()
+
+    asyncio.run(main())
+
+def test_early_exit_from_body_releases_in_flight(stub_server):
+    async def main():
+        async with stub_server() as server:
+            http = client()
+            with pytest.raises(RuntimeError):
+                async with http.get(f'{server.url}/ok'):
+                    raise RuntimeError
+            assert http.metrics()['in_flight'] == 0
+            await http.close()
+
+    asyncio.run(main())
+
+def test_post_is_not_retried_on_server_error(stub_server):
+    async def main():
+        async with stub_server() as server:
+            http = client()
+            server.statuses['/post'] = [500, 200]
+            async with http.post(f'{server.url}/post') as response:
+                assert response.status == 500
+            assert server.hits['/post'] == 1
+
+            server.statuses['/opt-in'] = [500, 200]
+            async with http.post(f'{server.url}/opt-in', retry=True) as response:
+                assert response.status == 200
+            assert server.hits['/opt-in'] == 2
+            await http.close()
+
+    asyncio.run(main())
+
+def test_rate_limited_post_and_failing_get_are_retried(stub_server):
+    async def main():
+        async with stub_server() as server:
+            http = client()
+            server.statuses['/limited'] = [429, 200]
+            async with http.post(f'{server.url}/limited') as response:
+                assert response.status == 200
+            assert server.hits['/limited'] == 2
+
+            server.statuses['/flaky'] = [503, 502, 200]
+            async with http.get(f'{server.url}/flaky') as response:
+                assert response.status == 200
+            assert server.hits['/flaky'] == 3
+            assert http.metrics()['in_flight'] == 0
+            await http.close()
+
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import asyncio
+import time
+from Vile.left_roles import LeftRoleStore
+from Vile.storage import SQLiteStorage
+
+def test_spilled_entries_are_read_back_and_expired_in_storage(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'))
+        store = LeftRoleStore(storage, retention=100, max_entries=10)
+        for user_id in range(20):
+            store.put(1, user_id, [user_id, 500])
+
+        assert len(store) <= 10
+        assert await store.pop(1, 0) == [0, 500]
+        assert await store.pop(1, 0) == []
+
+        await storage.flush()
+        store.retention = 0.01
+        await asyncio.sleep(0.05)
+        store.compact()
+        await store._expire_task
+        assert await storage.load('left_roles') == {}
+        assert await store.pop(1, 1) == []
+        await storage.close()
+
+    asyncio.run(main())
+
+def test_load_expires_old_rows_with_one_query(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'))
+        storage.set('left_roles', 1, 5, {'roles': [1], 'left_at': time.time() - 1000})
+        storage.set('left_roles', 1, 6, {'roles': [2], 'left_at': time.time()})
+        store = LeftRoleStore(storage, retention=100)
+        await store.load()
+        assert len(store) == 1
+        assert list((await storage.load('left_roles'))['1']) == ['6']
+        await storage.close()
+
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+import asyncio
+import types
+import discord
+from Vile.moderation_api import ModerationAPI
+from Vile.storage import Storage
+
+class BanGuild:
+    def __init__(self, manage_guild=True, bulk_forbidden=False):
+        self.id = 1
+        self.me = types.SimpleNamespace(guild_permissions=types.SimpleNamespace(manage_guild=manage_guild))
+        self.bulk_forbidden = bulk_forbidden
+        self.bulk_calls = 0
+        self.banned = []
+
+    async def bulk_ban(self, users, reason=None, delete_message_seconds=0):
+        self.bulk_calls += 1
+        if self.bulk_forbidden:
+            raise discord.Forbidden(types.SimpleNamespace(status=403, reason='Forbidden'), 'Missing Permissions')
+        self.banned.extend(user.id for user in users)
+        return types.SimpleNamespace(banned=list(users), failed=[])
+
+    async def ban(self, user, reason=None, delete_message_days=0):
+        self.banned.append(user.id)
+
+def mass_ban(guild, count=5):
+    api = ModerationAPI(types.SimpleNamespace(), Storage())
+    return api.mass_ban(guild, [discord.Object(id=user_id) for user_id in range(1, count + 1)])
+
+def test_bulk_ban_used_with_manage_guild():
+    guild = BanGuild()
+    summary = asyncio.run(mass_ban(guild))
+    assert guild.bulk_calls == 1
+    assert summary['succeeded'] == 5
+
+def test_ban_only_permission_falls_back_to_per_user_bans():
+    guild = BanGuild(manage_guild=False)
+    summary = asyncio.run(mass_ban(guild))
+    assert guild.bulk_calls == 0
+    assert sorted(guild.banned) == [1, 2, 3, 4, 5]
+    assert summary['succeeded'] == 5
+
+def test_forbidden_bulk_ban_falls_back_to_per_user_bans():
+    guild = BanGuild(bulk_forbidden=True)
+    summary = asyncio.run(mass_ban(guild))
+    assert guild.bulk_calls == 1
+    assert sorted(guild.banned) == [1, 2, 3, 4, 5]
+    assert summary['succeeded'] == 5
@@ -0,0 +1,86 @@
+import asyncio
+import types
+import discord
+import pytest
+from Vile.instrumentation import metrics
+from Vile.message_api import MessageAPI
+
+class FailingChannel:
+    id = 10
+
+    async def send(self, *args, **kwargs):
+        raise RuntimeError("send failed")
+
+class FakeGuild:
+    id = 1
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.name = f'user{user_id}'
+        self.mention = f'<@{user_id}>'
+
+class TimeoutFailingAuthor(FakeAuthor):
+    def __init__(self, user_id):
+        super().__init__(user_id)
+        self.timeouts = 0
+
+    async def timeout(self, duration, reason=None):
+        self.timeouts += 1
+        raise discord.Forbidden(types.SimpleNamespace(status=403, reason='Forbidden'), 'Missing Permissions')
+
+class FakeMessage:
+    def __init__(self, content, author, mentions=()):
+        self.content = content
+        self.author = author
+        self.mentions = list(mentions)
+        self.raw_mentions = [mention.id for mention in self.mentions]
+        self.raw_role_mentions = []
+        self.mention_everyone = False
+        self.guild = FakeGuild()
+        self.channel = FailingChannel()
+        self.created_at = discord.utils.utcnow()
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+def test_stage_errors_propagate_with_one_or_many_stages():
+    async def main():
+        api = MessageAPI(object())
+        await api.add_autoresponder('1', 'hello', 'hi')
+        with pytest.raises(RuntimeError):
+            await api.handle_message(FakeMessage('hello', FakeAuthor(2)))
+
+        await api.set_afk(3, 'away')
+        metrics.reset()
+        metrics.enable()
+        try:
+            with pytest.raises(RuntimeError):
+                await api.handle_message(FakeMessage('hello', FakeAuthor(2), [FakeAuthor(3)]))
+        finally:
+            metrics.enabled = False
+        assert sum(metrics.errors.values()) == 1
+
+    asyncio.run(main())
+
+def test_repeated_messages_after_a_spam_action_keep_being_tracked():
+    async def main():
+        api = MessageAPI(object())
+        await api.set_spam_settings('1', {'enabled': True, 'message_limit': 10, 'duplicate_limit': 3, 'action': 'timeout'})
+        author = TimeoutFailingAuthor(2)
+        messages = [FakeMessage('same', author) for _ in range(7)]
+        metrics.reset()
+        metrics.enable()
+        try:
+            for message in messages:
+                await api.handle_message(message)
+        finally:
+            metrics.enabled = False
+
+        assert [message.deleted for message in messages] == [False, False, True, False, False, True, False]
+        assert author.timeouts == 2
+        assert metrics.errors == {'MessageAPI._handle_spam:Forbidden': 2}
+
+    asyncio.run(main())
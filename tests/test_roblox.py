@@ -0,0 +1,36 @@
+import asyncio
+import aiohttp
+import pytest
+from Vile.http_client import HTTPClient
+from Vile.roblox import RobloxAPI
+
+def roblox_api(server):
+    api = RobloxAPI(http=HTTPClient(max_retries=0))
+    api.api_url = server.url
+    return api
+
+def test_failed_page_is_raised_instead_of_truncating(stub_server):
+    async def main():
+        async with stub_server() as server:
+            api = roblox_api(server)
+            server.bodies['/users/1/friends'] = {'data': [{'id': index} for index in range(100)], 'nextPageCursor': 'next'}
+            server.statuses['/users/1/friends'] = [200, 500]
+            seen = []
+            with pytest.raises(aiohttp.ClientResponseError):
+                async for friend in api.iter_user_friends(1):
+                    seen.append(friend)
+            assert len(seen) == 100
+            await api.close()
+
+    asyncio.run(main())
+
+def test_last_short_page_ends_iteration(stub_server):
+    async def main():
+        async with stub_server() as server:
+            api = roblox_api(server)
+            server.bodies['/users/1/badges'] = {'data': [{'id': index} for index in range(30)]}
+            assert len([badge async for badge in api.iter_user_badges(1)]) == 30
+            assert server.hits['/users/1/badges'] == 1
+            await api.close()
+
+    asyncio.run(main())
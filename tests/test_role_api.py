@@ -0,0 +1,44 @@
+import asyncio
+import aiohttp
+from benchmarks.fake_rest import FakeRESTServer
+from benchmarks.fakes import FakeBot, FakeREST
+from Vile.instrumentation import metrics
+from Vile.role_api import RoleAPI
+
+def test_join_queue_survives_network_errors():
+    async def main():
+        async with FakeRESTServer(latency=0) as server:
+            rest = FakeREST(server.url)
+            bot = FakeBot(rest)
+            guild = bot.add_guild()
+            api = RoleAPI(bot)
+            api.join_wave_threshold = 2
+            api.join_wave_rate = 100
+            await api.setup_autorole(str(guild.id), guild.add_role('autorole').id)
+
+            members = [guild.add_member() for _ in range(5)]
+
+            async def unreachable(*roles, **kwargs):
+                raise aiohttp.ClientConnectionError("connection reset")
+
+            members[1].add_roles = unreachable
+            metrics.reset()
+            metrics.enable()
+            try:
+                for member in members:
+                    await api.handle_member_join(member)
+                await asyncio.wait_for(rest.settle(lambda: api._join_workers), 5)
+
+                late = guild.add_member()
+                await api.handle_member_join(late)
+                await asyncio.wait_for(rest.settle(lambda: api._join_workers), 5)
+            finally:
+                metrics.enabled = False
+            await rest.close()
+
+        assert [len(member._roles) for member in members] == [1, 0, 1, 1, 1]
+        assert len(late._roles) == 1
+        assert not api._join_queues and not api._join_workers
+        assert metrics.errors == {'RoleAPI._apply_join_roles:ClientConnectionError': 1}
+
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+import asyncio
+import types
+import discord
+from Vile.instrumentation import metrics
+from Vile.role_batcher import RoleEditBatcher
+
+class FakeRole:
+    def __init__(self, role_id, assignable=True):
+        self.id = role_id
+        self.assignable = assignable
+
+    def is_assignable(self):
+        return self.assignable
+
+    def is_default(self):
+        return self.id == 0
+
+class FakeGuild:
+    def __init__(self, *roles):
+        self.id = 1
+        self.roles = {role.id: role for role in roles}
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+class FakeMember:
+    def __init__(self, guild, user_id, roles):
+        self.guild = guild
+        self.id = user_id
+        self.roles = list(roles)
+        self.server_roles = {role.id for role in roles}
+        self.calls = []
+        guild.members[user_id] = self
+
+    async def add_roles(self, *roles, reason=None):
+        self.calls.append(('add', [role.id for role in roles]))
+        self.server_roles.update(role.id for role in roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        self.calls.append(('remove', [role.id for role in roles]))
+        self.server_roles.difference_update(role.id for role in roles)
+
+    async def edit(self, roles, reason=None):
+        self.calls.append(('edit', sorted(role.id for role in roles)))
+        self.server_roles = {role.id for role in roles}
+
+def setup():
+    roles = [FakeRole(index) for index in range(6)]
+    guild = FakeGuild(*roles)
+    member = FakeMember(guild, 10, [roles[0], roles[1]])
+    return roles, guild, member
+
+def test_single_add_uses_atomic_call_and_keeps_unseen_roles():
+    async def main():
+        roles, guild, member = setup()
+        batcher = RoleEditBatcher(window=0.01)
+        batcher.add(member, roles[2])
+        member.server_roles.add(5)
+        await batcher.flush()
+        assert member.calls == [('add', [2])]
+        assert member.server_roles == {0, 1, 2, 5}
+
+    asyncio.run(main())
+
+def test_single_remove_uses_atomic_call():
+    async def main():
+        roles, guild, member = setup()
+        batcher = RoleEditBatcher(window=0.01)
+        batcher.add(member, roles[3])
+        batcher.remove(member, roles[3], roles[1])
+        await batcher.flush()
+        assert member.calls == [('remove', [1])]
+
+    asyncio.run(main())
+
+def test_multi_role_diff_uses_one_edit_without_unknown_roles():
+    async def main():
+        roles, guild, member = setup()
+        member.roles.append(FakeRole(99))
+        batcher = RoleEditBatcher(window=0.01)
+        batcher.add(member, roles[2], roles[3])
+        batcher.remove(member, roles[1])
+        await batcher.flush()
+        assert member.calls == [('edit', [2, 3])]
+
+    asyncio.run(main())
+
+def test_noop_and_unassignable_changes_skip_requests():
+    async def main():
+        roles, guild, member = setup()
+        batcher = RoleEditBatcher(window=0.01)
+        batcher.add(member, roles[1], FakeRole(4, assignable=False))
+        await asyncio.sleep(0.05)
+        assert member.calls == []
+        assert batcher.stats()['edits'] == 0
+
+    asyncio.run(main())
+
+def test_shared_batcher_merges_changes_from_both_sources():
+    async def main():
+        roles, guild, member = setup()
+        bot = type('Bot', (), {})()
+        batcher = RoleEditBatcher.shared(bot)
+        assert RoleEditBatcher.shared(bot) is batcher
+        batcher.add(member, roles[2], window=0.5, reason="Reaction role")
+        await asyncio.sleep(0)
+        batcher.add(member, roles[3], window=0.01, reason="Voice role")
+        await asyncio.sleep(0.1)
+        assert member.calls == [('edit', [1, 2, 3])]
+        assert batcher.stats()['pending'] == 0
+
+    asyncio.run(main())
+
+def test_failed_edit_is_recorded_and_counted():
+    async def main():
+        roles, guild, member = setup()
+
+        async def forbidden(*roles, reason=None):
+            raise discord.Forbidden(types.SimpleNamespace(status=403, reason='Forbidden'), 'Missing Permissions')
+
+        member.add_roles = forbidden
+        batcher = RoleEditBatcher(window=0.01)
+        metrics.reset()
+        metrics.enable()
+        try:
+            batcher.add(member, roles[2])
+            await asyncio.sleep(0.05)
+        finally:
+            metrics.enabled = False
+        assert batcher.stats()['failed'] == 1
+        assert metrics.errors == {'RoleEditBatcher._apply:Forbidden': 1}
+
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+import asyncio
+import sqlite3
+from Vile.storage import SQLiteStorage
+
+def test_failed_flush_keeps_batch_and_newer_values(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'), flush_interval=0.01)
+        write_batch = storage._write_batch
+        failures = []
+
+        def flaky(upserts, deletes):
+            if not failures:
+                failures.append(True)
+                storage.set('afk', 1, 'user', {'reason': 'newer'})
+                raise sqlite3.OperationalError('database is locked')
+            write_batch(upserts, deletes)
+
+        storage._write_batch = flaky
+        storage.set('afk', 1, 'user', {'reason': 'older'})
+        storage.set('afk', 1, 'other', {'reason': 'kept'})
+
+        await asyncio.sleep(0.2)
+        assert failures
+        assert not storage._pending
+        assert await storage.get('afk', 1, 'user') == {'reason': 'newer'}
+        assert await storage.get('afk', 1, 'other') == {'reason': 'kept'}
+        await storage.close()
+
+    asyncio.run(main())
+
+def test_unserializable_value_does_not_block_flush(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'))
+        storage.set('afk', 1, 'bad', {'reason': object()})
+        storage.set('afk', 1, 'good', {'reason': 'ok'})
+        await storage.flush()
+        assert not storage._pending
+        assert await storage.get('afk', 1, 'good') == {'reason': 'ok'}
+        assert await storage.get('afk', 1, 'bad') is None
+        await storage.close()
+
+    asyncio.run(main())
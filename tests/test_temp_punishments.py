@@ -0,0 +1,202 @@
+import asyncio
+import types
+import discord
+from Vile.moderation_api import ModerationAPI
+from Vile.storage import Storage
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.rows = {}
+
+    def set(self, namespace, guild_id, key, value):
+        self.rows[(namespace, str(guild_id), str(key))] = value
+
+    def delete(self, namespace, guild_id, key):
+        self.rows.pop((namespace, str(guild_id), str(key)), None)
+
+class FakeMember:
+    def __init__(self, guild, user_id, role_ids):
+        self.guild = guild
+        self.id = user_id
+        self.role_ids = set(role_ids)
+
+    def get_role(self, role_id):
+        return discord.Object(id=role_id) if role_id in self.role_ids else None
+
+    async def remove_roles(self, *roles, reason=None):
+        await asyncio.sleep(0)
+        self.guild.calls += 1
+        for role in roles:
+            self.role_ids.discard(role.id)
+
+class FakeGuild:
+    def __init__(self, guild_id, failures=0, missing=()):
+        self.id = guild_id
+        self.unbanned = []
+        self.members = {}
+        self.failures = failures
+        self.missing = set(missing)
+        self.calls = 0
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def unban(self, user, reason=None):
+        await asyncio.sleep(0)
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise discord.HTTPException(types.SimpleNamespace(status=500, reason='Server Error'), 'boom')
+        if user.id in self.missing:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason='Not Found'), 'Unknown Ban')
+        self.unbanned.append(user.id)
+
+class FakeBot:
+    def __init__(self, *guilds):
+        self.guilds = {guild.id: guild for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+def make_api(*guilds):
+    storage = MemoryStorage()
+    api = ModerationAPI(FakeBot(*guilds), storage)
+    api.expiry_retry_delay = 0.01
+    api.expiry_retry_max = 0.05
+    return api, storage
+
+async def wait_until(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+def test_thousands_of_concurrent_bans_expire_once():
+    async def main():
+        guilds = [FakeGuild(guild_id) for guild_id in range(1, 6)]
+        api, storage = make_api(*guilds)
+        for user_id in range(5000):
+            api._set_temp_punishment('ban', guilds[user_id % 5].id, user_id, 0.05 + (user_id % 10) / 100)
+
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        unbanned = sorted(user_id for guild in guilds for user_id in guild.unbanned)
+        assert unbanned == list(range(5000))
+        assert not [key for key in storage.rows if key[0] == 'temp_bans']
+
+    asyncio.run(main())
+
+def test_thousands_of_concurrent_mutes_expire():
+    async def main():
+        guild = FakeGuild(1)
+        api, storage = make_api(guild)
+        api._muted_roles[1] = 99
+        for user_id in range(3000):
+            guild.members[user_id] = FakeMember(guild, user_id, {99})
+            api._set_temp_punishment('mute', 1, user_id, 0.05, role_id=99)
+
+        await wait_until(lambda: not api._temp_mutes)
+        api.stop_expiry_scheduler()
+        assert all(not member.role_ids for member in guild.members.values())
+        assert guild.calls == 3000
+        assert not [key for key in storage.rows if key[0] == 'temp_mutes']
+
+    asyncio.run(main())
+
+def test_uncached_guild_keeps_ban_until_available():
+    async def main():
+        guild = FakeGuild(7)
+        api, storage = make_api()
+        api._set_temp_punishment('ban', 7, 42, 0.01)
+
+        await asyncio.sleep(0.1)
+        assert (7, 42) in api._temp_bans
+        assert ('temp_bans', '7', '42') in storage.rows
+
+        api.bot.guilds[7] = guild
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        assert guild.unbanned == [42]
+        assert ('temp_bans', '7', '42') not in storage.rows
+
+    asyncio.run(main())
+
+def test_transient_error_is_retried_with_backoff():
+    async def main():
+        guild = FakeGuild(1, failures=3)
+        api, storage = make_api(guild)
+        api._set_temp_punishment('ban', 1, 5, 0.01)
+
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        assert guild.unbanned == [5]
+        assert guild.calls == 4
+
+    asyncio.run(main())
+
+def test_not_found_clears_entry():
+    async def main():
+        guild = FakeGuild(1, missing={5})
+        api, storage = make_api(guild)
+        api._set_temp_punishment('ban', 1, 5, 0.01)
+
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        assert guild.unbanned == []
+        assert not storage.rows
+
+    asyncio.run(main())
+
+def test_extended_ban_supersedes_earlier_expiry():
+    async def main():
+        guild = FakeGuild(1)
+        api, storage = make_api(guild)
+        api._set_temp_punishment('ban', 1, 5, 0.01)
+        api._set_temp_punishment('ban', 1, 5, 0.3)
+
+        await asyncio.sleep(0.1)
+        assert guild.unbanned == []
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        assert guild.unbanned == [5]
+
+    asyncio.run(main())
+
+def test_manual_unban_between_pop_and_expiry_is_skipped():
+    async def main():
+        guild = FakeGuild(1)
+        api, storage = make_api(guild)
+        api._set_temp_punishment('ban', 1, 5, 0)
+        api._set_temp_punishment('ban', 1, 6, 0)
+        api.stop_expiry_scheduler()
+
+        check = asyncio.ensure_future(api.check_temp_punishments())
+        await asyncio.sleep(0)
+        api._clear_temp_punishment('ban', 1, 6)
+        await check
+        assert guild.unbanned == [5]
+        assert not api._temp_bans
+
+    asyncio.run(main())
+
+def test_scheduler_survives_a_failing_pass():
+    async def main():
+        guild = FakeGuild(1)
+        api, storage = make_api(guild)
+        check = api.check_temp_punishments
+        failures = [RuntimeError("boom")]
+
+        async def flaky():
+            if failures:
+                raise failures.pop()
+            await check()
+
+        api.check_temp_punishments = flaky
+        api._set_temp_punishment('ban', 1, 5, 0.01)
+        api._set_temp_punishment('ban', 1, 6, 0.05)
+
+        await wait_until(lambda: not api._temp_bans)
+        api.stop_expiry_scheduler()
+        assert sorted(guild.unbanned) == [5, 6]
+
+    asyncio.run(main())
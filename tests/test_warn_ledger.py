@@ -0,0 +1,39 @@
+import asyncio
+from Vile.storage import SQLiteStorage
+from Vile.warn_ledger import WarnLedger
+
+def test_out_of_order_warn_keeps_its_timestamp():
+    ledger = WarnLedger()
+    for timestamp in (1000, 1009):
+        ledger.add(1, 5, 99, 'spam', timestamp)
+    ledger.add(1, 5, 99, 'late', 1005)
+    ledger.add(1, 6, 99, 'other', 1004)
+
+    assert [warn['timestamp'] for warn in ledger.get(1, 5)] == [1000, 1005, 1009]
+    assert [warn['reason'] for warn in ledger.range(1, 1003, 1006)] == ['other', 'late']
+    assert [warn['reason'] for warn in ledger.range(1, 1003, 1006, user_id=5)] == ['late']
+    assert ledger.count(1, 5, 1001, 1009) == 2
+
+def test_cleared_user_is_excluded_from_guild_range():
+    ledger = WarnLedger()
+    ledger.add(1, 5, 99, 'a', 1000)
+    ledger.add(1, 6, 99, 'b', 1001)
+    assert ledger.clear(1, 5)
+    assert [warn['user_id'] for warn in ledger.range(1)] == [6]
+    assert ledger.count(1, 5) == 0
+
+def test_load_handles_ties_and_missing_reasons(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'state.db'))
+        storage.set('warns', 1, 5, [
+            {'reason': None, 'timestamp': 1000, 'moderator_id': 2},
+            {'reason': 'x', 'timestamp': '1970-01-01T00:16:40+00:00', 'moderator_id': 3}
+        ])
+        storage.set('warns', 1, 6, [{'reason': None, 'timestamp': 1000, 'moderator_id': 2}])
+        ledger = WarnLedger(storage)
+        await ledger.load()
+        assert ledger.count(1, 5, 1000, 1000) == 2
+        assert len(ledger.range(1, 1000, 1000)) == 3
+        await storage.close()
+
+    asyncio.run(main())